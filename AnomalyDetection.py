@@ -0,0 +1,100 @@
+import argparse
+
+import numpy as np
+import pandas as pd
+
+from ColumnarTables import load_tables
+from ItemKeys import composite_key
+
+anomaly_metrics = ["finalPrice", "itemPrice", "quantityPurchased", "pointsEarned"]
+
+# Columns the anomaly stage reads
+anomaly_columns = {
+    "rewards_items": ["brandCode", "description"] + anomaly_metrics,
+    "brands": ["brandCode", "category"],
+}
+
+
+# Linear-interpolated quantile q of every group, values must be sorted by (group code, value)
+def grouped_quantile(sorted_values, starts, counts, q):
+    position = starts + q * np.maximum(counts - 1, 0)
+    lo = np.floor(position).astype(np.int64)
+    hi = np.ceil(position).astype(np.int64)
+    last = max(len(sorted_values) - 1, 0)
+    lo, hi = np.minimum(lo, last), np.minimum(hi, last)
+    if len(sorted_values) == 0:
+        return np.full(len(counts), np.nan)
+    result = sorted_values[lo] + (sorted_values[hi] - sorted_values[lo]) * (position - lo)
+    return np.where(counts > 0, result, np.nan)
+
+
+# Median, MAD, Q1 and Q3 of every group with two sorts instead of a Python loop over groups
+def grouped_robust_stats(codes, values, n_groups):
+    counts = np.bincount(codes, minlength=n_groups)
+    starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+
+    order = np.lexsort((values, codes))
+    sorted_values = values[order]
+    median = grouped_quantile(sorted_values, starts, counts, 0.5)
+    q1 = grouped_quantile(sorted_values, starts, counts, 0.25)
+    q3 = grouped_quantile(sorted_values, starts, counts, 0.75)
+
+    deviation = np.abs(values - median[codes])
+    mad = grouped_quantile(deviation[np.lexsort((deviation, codes))], starts, counts, 0.5)
+    return counts, median, mad, q1, q3
+
+
+# Flag items whose price, quantity or points are outliers within their brand and category.
+# Robust z-score 0.6745 * (x - median) / MAD above z_threshold, or outside the Q1/Q3 IQR fences when
+# MAD is 0 (most items of the group share one value). Groups smaller than min_group_size are not flagged,
+# nor are items without a brandCode since their group mixes unrelated products
+def detect_anomalies(items, brands, z_threshold=3.5, iqr_factor=1.5, min_group_size=5):
+    categories = brands.dropna(subset=["brandCode"]).drop_duplicates("brandCode")[["brandCode", "category"]]
+    items = items.merge(categories, on="brandCode", how="left")
+    groups, codes = np.unique(composite_key(items, ["brandCode", "category"]), return_inverse=True)
+    codes = codes.reshape(-1)
+    branded = items["brandCode"].notna().to_numpy(dtype=bool)
+
+    flags = pd.DataFrame(index=items.index)
+    for metric in anomaly_metrics:
+        values = pd.to_numeric(items[metric], errors="coerce").to_numpy(dtype=float, na_value=np.nan)
+        present = ~np.isnan(values)
+        counts, median, mad, q1, q3 = grouped_robust_stats(codes[present], values[present], len(groups))
+
+        group = codes[present]
+        x = values[present]
+        iqr = q3[group] - q1[group]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            z = 0.6745 * (x - median[group]) / mad[group]
+        outside_fences = (x < q1[group] - iqr_factor * iqr) | (x > q3[group] + iqr_factor * iqr)
+        outlier = np.where(mad[group] > 0, np.abs(z) > z_threshold, (iqr > 0) & outside_fences)
+        outlier &= (counts[group] >= min_group_size) & branded[present]
+
+        flag = np.zeros(len(items), dtype=bool)
+        flag[present] = outlier
+        flags[f"{metric}_outlier"] = flag
+        group_median = np.full(len(items), np.nan)
+        group_median[present] = median[group]
+        flags[f"{metric}_group_median"] = group_median
+
+    return pd.concat([items, flags], axis=1)
+
+
+def anomaly_summary(flagged):
+    return {metric: int(flagged[f"{metric}_outlier"].sum()) for metric in anomaly_metrics}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Flag price and points outliers per brand and category")
+    parser.add_argument("--data-dir", default=None, help="directory holding the JSON exports")
+    parser.add_argument("--z", type=float, default=3.5, help="robust z-score threshold")
+    parser.add_argument("--min-group-size", type=int, default=5)
+    args = parser.parse_args()
+
+    tables = load_tables(args.data_dir, anomaly_columns)
+    flagged = detect_anomalies(tables["rewards_items"], tables["brands"], args.z, min_group_size=args.min_group_size)
+    print(f"Items: {len(flagged)}")
+    for metric, count in anomaly_summary(flagged).items():
+        print(f"\nOutlier {metric} values: {count}")
+        examples = flagged[flagged[f"{metric}_outlier"]]
+        print(examples[["receipt_id", "brandCode", "category", "description", metric, f"{metric}_group_median"]].head())
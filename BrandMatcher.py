@@ -0,0 +1,118 @@
+import argparse
+import re
+import unicodedata
+from collections import Counter, defaultdict
+
+import numpy as np
+
+from LoadData import flatten_items, load_records
+
+
+# Upper case ASCII letters and digits only, so "Ben & Jerry's®" and "BEN AND JERRYS" share most trigrams
+def normalize(text):
+    text = unicodedata.normalize("NFKD", str(text)).encode("ascii", "ignore").decode("ascii").upper()
+    return " " + " ".join(re.sub(r"[^A-Z0-9]+", " ", text).split()) + " "
+
+
+def tokens(text):
+    return normalize(text).split()
+
+
+def trigrams(text):
+    text = normalize(text)
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+# Each brand word needs its own whole word in the description, so "Pizza Pizza Pizza" needs three PIZZA
+# words and "SIMPLE" does not match inside "SIMPLYORANGEJCE"
+def words_match(brand_words, description_words):
+    available = Counter(description_words)
+    available.subtract(brand_words)
+    return min(available.values(), default=0) >= 0
+
+
+# Trigram inverted index over brand names: each trigram points at the brands whose name contains it
+class BrandIndex:
+    def __init__(self, brands, max_posting_fraction=0.02, min_grams=5):
+        self.brands = [brand for brand in brands if brand.get("name")]
+        self.tokens = [tokens(brand["name"]) for brand in self.brands]
+        postings = defaultdict(list)
+        for brand_id, brand in enumerate(self.brands):
+            for gram in trigrams(brand["name"]):
+                postings[gram].append(brand_id)
+
+        # Trigrams shared by many brands (" TH", "ING") carry no signal and make the posting lists long
+        limit = max(1, int(max_posting_fraction * len(self.brands)))
+        self.postings = {gram: np.array(ids, dtype=np.int32) for gram, ids in postings.items() if len(ids) <= limit}
+        self.gram_counts = np.zeros(len(self.brands), dtype=np.int32)
+        for ids in self.postings.values():
+            self.gram_counts[ids] += 1
+        # Very short names ("test", "A&W") would match inside unrelated descriptions
+        self.gram_counts[self.gram_counts < min_grams] = 0
+
+    # Brands ranked by the share of their name trigrams found in the description. Trigrams only propose
+    # candidates, a candidate is kept when every word of its name is a whole word of the description
+    def candidates(self, description, min_score=0.8, top=3):
+        lists = [self.postings[gram] for gram in trigrams(description) if gram in self.postings]
+        if not lists:
+            return []
+        hits = np.bincount(np.concatenate(lists), minlength=len(self.brands))
+        scores = np.divide(hits, self.gram_counts, out=np.zeros(len(self.brands)), where=self.gram_counts > 0)
+        words = tokens(description)
+        found = np.array([brand_id for brand_id in np.flatnonzero(scores >= min_score)
+                          if words_match(self.tokens[brand_id], words)], dtype=np.int64)
+        # Ties go to the longer name, "KRAFT HEINZ" over "KRAFT" when both are contained
+        found = found[np.lexsort((-self.gram_counts[found], -scores[found]))][:top]
+        return [(self.brands[brand_id], float(scores[brand_id])) for brand_id in found]
+
+    # Best brand for each description, each distinct description is only scored once
+    def match(self, descriptions, min_score=0.8):
+        best = {}
+        results = []
+        for description in descriptions:
+            if description not in best:
+                found = self.candidates(description, min_score, top=1) if description else []
+                best[description] = found[0] if found else (None, 0.0)
+            results.append(best[description])
+        return results
+
+
+# Descriptions that are placeholders rather than product names
+unmatchable_descriptions = {"ITEM NOT FOUND", "DELETED ITEM"}
+
+
+# Items that join to brands on barcode or brandCode, and how many more a description match adds
+def description_coverage(items, brands, min_score=0.8):
+    barcodes = {brand["barcode"] for brand in brands if brand.get("barcode")}
+    brand_codes = {brand["brandCode"] for brand in brands if brand.get("brandCode")}
+    unjoined = [item for item in items
+                if item.get("barcode") not in barcodes and item.get("brandCode") not in brand_codes]
+    descriptions = [item.get("description") for item in unjoined
+                    if item.get("description") and normalize(item["description"]).strip() not in unmatchable_descriptions]
+
+    index = BrandIndex(brands)
+    matches = index.match(descriptions, min_score)
+    matched = [(description, brand["name"], score)
+               for description, (brand, score) in zip(descriptions, matches) if brand is not None]
+    return {
+        "items": len(items),
+        "joined_on_keys": len(items) - len(unjoined),
+        "matched_on_description": len(matched),
+        "examples": sorted(set(matched))[:10],
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Match receipt item descriptions to brand names")
+    parser.add_argument("--min-score", type=float, default=0.8, help="share of brand name trigrams required")
+    args = parser.parse_args()
+
+    items = flatten_items(load_records("receipts"))
+    brands = load_records("brands")
+    coverage = description_coverage(items, brands, args.min_score)
+    print(f"Total items: {coverage['items']}")
+    print(f"Items joined to brands on barcode or brandCode: {coverage['joined_on_keys']}")
+    print(f"Additional items matched on description: {coverage['matched_on_description']}")
+    print("\nMatch examples (description, brand, score):")
+    for example in coverage["examples"]:
+        print(example)
@@ -0,0 +1,153 @@
+import calendar
+import sys
+from collections import defaultdict
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+
+from LoadData import load_records, oid, date_ms, to_float
+
+
+# Midnight of CURRENT_DATE - INTERVAL 'N months' in epoch milliseconds (same semantics as the SQL filter)
+def months_ago_ms(months, now=None):
+    now = now or datetime.now(timezone.utc)
+    month_index = now.year * 12 + (now.month - 1) - months
+    year, month = divmod(month_index, 12)
+    month += 1
+    # Clamp the day like Postgres does, e.g. 2021-08-31 - 6 months = 2021-02-28
+    day = min(now.day, calendar.monthrange(year, month)[1])
+    cutoff = datetime(year, month, day, tzinfo=timezone.utc)
+    return int(cutoff.timestamp() * 1000)
+
+
+# Monthly cohort label ("2021-01") of an epoch milliseconds timestamp
+def cohort_label(created_ms):
+    return datetime.fromtimestamp(created_ms / 1000, tz=timezone.utc).strftime("%Y-%m")
+
+
+class CohortIndex:
+    # Users sorted by decoded createdDate, so "created within the past N months" is a binary search
+    def __init__(self, users):
+        # users.json has duplicated records, keep one createdDate per user id
+        created = {}
+        for user in users:
+            user_id = oid(user.get("_id"))
+            created_ms = date_ms(user.get("createdDate"))
+            if user_id is None or created_ms is None or user_id in created:
+                continue
+            created[user_id] = created_ms
+        self.index_created(created)
+
+    # Build the index from decoded columns (ids and createdDate in epoch milliseconds), e.g. a loaded users table
+    @classmethod
+    def from_columns(cls, user_ids, created_ms):
+        index = cls([])
+        created = {}
+        for user_id, ms in zip(user_ids, created_ms):
+            if user_id is None or ms is None or pd.isna(ms) or user_id in created:
+                continue
+            created[user_id] = int(ms)
+        index.index_created(created)
+        return index
+
+    def index_created(self, created):
+        ids = np.array(list(created.keys()), dtype=object)
+        times = np.array(list(created.values()), dtype=np.int64)
+        order = np.argsort(times, kind="stable")
+        self.user_ids = ids[order]
+        self.created_ms = times[order]
+        self.cohorts = {user_id: cohort_label(ms) for user_id, ms in created.items()}
+
+    def __len__(self):
+        return len(self.user_ids)
+
+    # Users created in [start_ms, end_ms), either bound may be None
+    def users_created_between(self, start_ms=None, end_ms=None):
+        lo = 0 if start_ms is None else np.searchsorted(self.created_ms, start_ms, side="left")
+        hi = len(self.created_ms) if end_ms is None else np.searchsorted(self.created_ms, end_ms, side="left")
+        return set(self.user_ids[lo:hi])
+
+    # Users matching u.createdDate >= CURRENT_DATE - INTERVAL 'N months'
+    def users_created_since(self, months, now=None):
+        return self.users_created_between(start_ms=months_ago_ms(months, now))
+
+    def cohort_of(self, user_id):
+        return self.cohorts.get(user_id)
+
+    # Semi-join receipts to a user id set instead of joining every receipt to users
+    @staticmethod
+    def semi_join_receipts(receipts, user_ids):
+        return [receipt for receipt in receipts if receipt.get("userId") in user_ids]
+
+
+# Brand name lookup by brandCode (brandCode is the join key used in FetchHomeWork.sql)
+def brand_names_by_code(brands):
+    return {brand["brandCode"]: brand["name"] for brand in brands if brand.get("brandCode")}
+
+
+# Largest value first, ties broken by brand name so every implementation of a question ranks alike
+def ranked(values):
+    return sorted(values.items(), key=lambda pair: (-pair[1], pair[0]))
+
+
+# Which brand has the most spend among users who were created within the past N months?
+def brand_spend_since(index, receipts, brands, months=6, now=None):
+    brand_names = brand_names_by_code(brands)
+    spend = defaultdict(float)
+    for receipt in index.semi_join_receipts(receipts, index.users_created_since(months, now)):
+        for item in receipt.get("rewardsReceiptItemList") or []:
+            name = brand_names.get(item.get("brandCode"))
+            quantity = to_float(item.get("quantityPurchased"))
+            final_price = to_float(item.get("finalPrice"))
+            if name is None or quantity is None or final_price is None:
+                continue
+            spend[name] += quantity * final_price
+    return ranked(spend)
+
+
+# Which brand has the most transactions among users who were created within the past N months?
+def brand_transactions_since(index, receipts, brands, months=6, now=None):
+    brand_names = brand_names_by_code(brands)
+    transactions = defaultdict(set)
+    for receipt in index.semi_join_receipts(receipts, index.users_created_since(months, now)):
+        receipt_id = oid(receipt.get("_id"))
+        for item in receipt.get("rewardsReceiptItemList") or []:
+            name = brand_names.get(item.get("brandCode"))
+            if name is not None:
+                transactions[name].add(receipt_id)
+    return ranked({name: len(receipt_ids) for name, receipt_ids in transactions.items()})
+
+
+# Brand spend grouped by the users' monthly signup cohort
+def brand_spend_by_cohort(index, receipts, brands):
+    brand_names = brand_names_by_code(brands)
+    spend = defaultdict(float)
+    for receipt in receipts:
+        cohort = index.cohort_of(receipt.get("userId"))
+        if cohort is None:
+            continue
+        for item in receipt.get("rewardsReceiptItemList") or []:
+            name = brand_names.get(item.get("brandCode"))
+            quantity = to_float(item.get("quantityPurchased"))
+            final_price = to_float(item.get("finalPrice"))
+            if name is None or quantity is None or final_price is None:
+                continue
+            spend[(cohort, name)] += quantity * final_price
+    return dict(spend)
+
+
+if __name__ == "__main__":
+    months = int(sys.argv[1]) if len(sys.argv) > 1 else 6
+    users = load_records("users")
+    receipts = load_records("receipts")
+    brands = load_records("brands")
+    index = CohortIndex(users)
+
+    # The export ends in 2021, so also evaluate the window relative to the latest signup
+    latest = datetime.fromtimestamp(int(index.created_ms[-1]) / 1000, tz=timezone.utc)
+    for label, now in [("CURRENT_DATE", None), ("latest createdDate", latest)]:
+        print(f"\nUsers created within the past {months} months of {label}: "
+              f"{len(index.users_created_since(months, now))}/{len(index)}")
+        print(f"Top brands by spend: {brand_spend_since(index, receipts, brands, months, now)[:5]}")
+        print(f"Top brands by transactions: {brand_transactions_since(index, receipts, brands, months, now)[:5]}")
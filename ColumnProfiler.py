@@ -0,0 +1,324 @@
+import argparse
+import base64
+import hashlib
+import json
+import math
+import random
+
+from LoadData import file_path, iter_json_lines, to_float
+
+
+# KLL quantile sketch: a stack of compactors where an item at level h stands for 2**h values
+class KLLSketch:
+    def __init__(self, k=200, c=2 / 3, seed=0):
+        self.k = k
+        self.c = c
+        self.random = random.Random(seed)
+        self.compactors = []
+        self.size = 0
+        self.max_size = 0
+        self.grow()
+
+    def grow(self):
+        self.compactors.append([])
+        self.max_size = sum(self.capacity(h) for h in range(len(self.compactors)))
+
+    def capacity(self, h):
+        depth = len(self.compactors) - h - 1
+        return int(math.ceil(self.k * self.c ** depth)) + 1
+
+    def update(self, value):
+        self.compactors[0].append(value)
+        self.size += 1
+        if self.size >= self.max_size:
+            self.compress()
+
+    # Compact the first full level: sort it and promote every other item to the next level
+    def compress(self):
+        for h in range(len(self.compactors)):
+            if len(self.compactors[h]) >= self.capacity(h):
+                if h + 1 >= len(self.compactors):
+                    self.grow()
+                level = sorted(self.compactors[h])
+                # Keep one item back when the level is odd so no weight is lost
+                kept = [level.pop()] if len(level) % 2 else []
+                offset = self.random.randint(0, 1)
+                self.compactors[h + 1].extend(level[offset::2])
+                self.compactors[h] = kept
+                self.size = sum(len(level) for level in self.compactors)
+                if self.size < self.max_size:
+                    break
+
+    def merge(self, other):
+        while len(self.compactors) < len(other.compactors):
+            self.grow()
+        for h, level in enumerate(other.compactors):
+            self.compactors[h].extend(level)
+        self.size = sum(len(level) for level in self.compactors)
+        while self.size >= self.max_size:
+            self.compress()
+        return self
+
+    # Approximate value at each quantile in qs (0..1)
+    def quantiles(self, qs):
+        weighted = sorted((value, 2 ** h) for h, level in enumerate(self.compactors) for value in level)
+        total = sum(weight for _, weight in weighted)
+        if total == 0:
+            return [None for _ in qs]
+        results = []
+        for q in qs:
+            target = q * total
+            cumulative = 0
+            answer = weighted[-1][0]
+            for value, weight in weighted:
+                cumulative += weight
+                if cumulative >= target:
+                    answer = value
+                    break
+            results.append(answer)
+        return results
+
+    def to_dict(self):
+        return {"k": self.k, "c": self.c, "compactors": self.compactors}
+
+    @classmethod
+    def from_dict(cls, data):
+        sketch = cls(data["k"], data["c"])
+        sketch.compactors = []
+        for _ in data["compactors"]:
+            sketch.grow()
+        sketch.compactors = [list(level) for level in data["compactors"]]
+        sketch.size = sum(len(level) for level in sketch.compactors)
+        return sketch
+
+
+# Space-Saving top-K: keeps at most `capacity` counters. A value that takes over an evicted counter inherits
+# its count as error, so each counter overestimates by at most its error and count - error is a lower bound.
+# Capacity is kept well above the number of values reported, only the head of the stream is reliable
+class TopK:
+    def __init__(self, capacity=1000):
+        self.capacity = capacity
+        self.counts = {}
+        self.errors = {}
+
+    def update(self, value, count=1):
+        if value in self.counts or len(self.counts) < self.capacity:
+            self.counts[value] = self.counts.get(value, 0) + count
+            self.errors.setdefault(value, 0)
+            return
+        smallest = min(self.counts, key=self.counts.get)
+        evicted = self.counts.pop(smallest)
+        del self.errors[smallest]
+        self.counts[value] = evicted + count
+        self.errors[value] = evicted
+
+    # Count a full sketch may have missed for a value it does not hold
+    def floor(self):
+        return min(self.counts.values()) if len(self.counts) >= self.capacity else 0
+
+    # Mergeable Space-Saving: a value missing from a full sketch may have been counted up to its smallest
+    # counter there, that amount is added to both the count and the error
+    def merge(self, other):
+        own_floor, other_floor = self.floor(), other.floor()
+        counts, errors = {}, {}
+        for value in set(self.counts) | set(other.counts):
+            counts[value] = self.counts.get(value, own_floor) + other.counts.get(value, other_floor)
+            errors[value] = self.errors.get(value, own_floor) + other.errors.get(value, other_floor)
+        kept = sorted(counts, key=counts.get, reverse=True)[:self.capacity]
+        self.counts = {value: counts[value] for value in kept}
+        self.errors = {value: errors[value] for value in kept}
+        return self
+
+    # The n most frequent values as (value, count, error): the true count lies in [count - error, count].
+    # `guaranteed` is set when the lower bound beats the next counter, so the value surely belongs above it
+    def top(self, n=10):
+        ranked = sorted(self.counts.items(), key=lambda pair: pair[1], reverse=True)
+        result = []
+        for i, (value, count) in enumerate(ranked[:n]):
+            next_count = ranked[i + 1][1] if i + 1 < len(ranked) else self.floor()
+            error = self.errors[value]
+            result.append({"value": value, "count": count, "error": error,
+                           "guaranteed": count - error >= next_count})
+        return result
+
+    def to_dict(self):
+        return {"capacity": self.capacity,
+                "counts": [[value, count, self.errors[value]] for value, count in self.counts.items()]}
+
+    @classmethod
+    def from_dict(cls, data):
+        sketch = cls(data["capacity"])
+        sketch.counts = {value: count for value, count, _ in data["counts"]}
+        sketch.errors = {value: error for value, _, error in data["counts"]}
+        return sketch
+
+
+# HyperLogLog distinct count estimate with 2**p registers
+class HyperLogLog:
+    def __init__(self, p=12):
+        self.p = p
+        self.m = 1 << p
+        self.registers = bytearray(self.m)
+
+    def update(self, value):
+        x = int.from_bytes(hashlib.blake2b(str(value).encode("utf-8"), digest_size=8).digest(), "big")
+        index = x >> (64 - self.p)
+        rest = x & ((1 << (64 - self.p)) - 1)
+        rank = (64 - self.p) - rest.bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def merge(self, other):
+        self.registers = bytearray(max(a, b) for a, b in zip(self.registers, other.registers))
+        return self
+
+    def estimate(self):
+        alpha = 0.7213 / (1 + 1.079 / self.m)
+        raw = alpha * self.m * self.m / sum(2.0 ** -r for r in self.registers)
+        zeros = self.registers.count(0)
+        # Linear counting for small cardinalities
+        if raw <= 2.5 * self.m and zeros:
+            return round(self.m * math.log(self.m / zeros))
+        return round(raw)
+
+    def to_dict(self):
+        return {"p": self.p, "registers": base64.b64encode(bytes(self.registers)).decode("ascii")}
+
+    @classmethod
+    def from_dict(cls, data):
+        sketch = cls(data["p"])
+        sketch.registers = bytearray(base64.b64decode(data["registers"]))
+        return sketch
+
+
+# Profile of one column: row and null counts, distinct estimate and a quantile or top-K sketch
+class ColumnProfile:
+    def __init__(self, kind):
+        self.kind = kind
+        self.rows = 0
+        self.nulls = 0
+        self.distinct = HyperLogLog()
+        self.sketch = KLLSketch() if kind == "numeric" else TopK()
+
+    def update(self, value):
+        self.rows += 1
+        if self.kind == "numeric":
+            value = to_float(value)
+        if value is None or value == "":
+            self.nulls += 1
+            return
+        self.distinct.update(value)
+        self.sketch.update(value)
+
+    def merge(self, other):
+        self.rows += other.rows
+        self.nulls += other.nulls
+        self.distinct.merge(other.distinct)
+        self.sketch.merge(other.sketch)
+        return self
+
+    def summary(self):
+        result = {
+            "rows": self.rows,
+            "null_pct": round(self.nulls / self.rows * 100, 4) if self.rows else None,
+            "distinct_estimate": self.distinct.estimate(),
+        }
+        if self.kind == "numeric":
+            qs = [0.0, 0.01, 0.25, 0.5, 0.75, 0.99, 1.0]
+            result["quantiles"] = dict(zip([str(q) for q in qs], self.sketch.quantiles(qs)))
+        else:
+            result["top"] = self.sketch.top(10)
+        return result
+
+    def to_dict(self):
+        return {"kind": self.kind, "rows": self.rows, "nulls": self.nulls,
+                "distinct": self.distinct.to_dict(), "sketch": self.sketch.to_dict()}
+
+    @classmethod
+    def from_dict(cls, data):
+        profile = cls(data["kind"])
+        profile.rows = data["rows"]
+        profile.nulls = data["nulls"]
+        profile.distinct = HyperLogLog.from_dict(data["distinct"])
+        sketch_class = KLLSketch if data["kind"] == "numeric" else TopK
+        profile.sketch = sketch_class.from_dict(data["sketch"])
+        return profile
+
+
+# Columns profiled per table
+profiled_columns = {
+    "receipts": {
+        "totalSpent": "numeric",
+        "pointsEarned": "numeric",
+    },
+    "rewards_items": {
+        "finalPrice": "numeric",
+        "itemPrice": "numeric",
+        "pointsEarned": "numeric",
+        "quantityPurchased": "numeric",
+        "brandCode": "categorical",
+        "description": "categorical",
+        "barcode": "categorical",
+    },
+}
+
+
+def new_profiles():
+    return {table: {column: ColumnProfile(kind) for column, kind in columns.items()}
+            for table, columns in profiled_columns.items()}
+
+
+# Build all column profiles in one streaming pass over receipts.json, items are profiled as they are unnested
+def profile_receipts(path):
+    profiles = new_profiles()
+    for receipt in iter_json_lines(path):
+        for column, profile in profiles["receipts"].items():
+            profile.update(receipt.get(column))
+        for item in receipt.get("rewardsReceiptItemList") or []:
+            for column, profile in profiles["rewards_items"].items():
+                profile.update(item.get(column))
+    return profiles
+
+
+# Merge the profiles of several slices of an export, e.g. profiles built in parallel
+def merge_profiles(profile_list):
+    merged = new_profiles()
+    for profiles in profile_list:
+        for table, columns in profiles.items():
+            for column, profile in columns.items():
+                merged[table][column].merge(profile)
+    return merged
+
+
+# Compact profile file: the readable summary plus the serialized sketches so files can be merged later
+def save_profiles(profiles, path):
+    data = {table: {column: {"summary": profile.summary(), "state": profile.to_dict()}
+                    for column, profile in columns.items()}
+            for table, columns in profiles.items()}
+    with open(path, "w", encoding="utf-8") as file:
+        json.dump(data, file)
+
+
+def load_profiles(path):
+    with open(path, "r", encoding="utf-8") as file:
+        data = json.load(file)
+    return {table: {column: ColumnProfile.from_dict(entry["state"]) for column, entry in columns.items()}
+            for table, columns in data.items()}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Profile receipts and item columns in one streaming pass")
+    parser.add_argument("inputs", nargs="*", help="receipts JSON files, defaults to receipts.json")
+    parser.add_argument("--merge", nargs="*", default=[], help="existing profile files to merge in")
+    parser.add_argument("--output", default="profile.json", help="profile file to write")
+    args = parser.parse_args()
+
+    inputs = args.inputs or ([] if args.merge else [file_path("receipts")])
+    profiles = merge_profiles([profile_receipts(path) for path in inputs] +
+                              [load_profiles(path) for path in args.merge])
+    save_profiles(profiles, args.output)
+
+    for table, columns in profiles.items():
+        print(f"\n{'=' * 30} COLUMN PROFILE FOR {table.capitalize()} {'=' * 30}")
+        for column, profile in columns.items():
+            print(f"{column}: {profile.summary()}")
@@ -0,0 +1,225 @@
+import io
+import itertools
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.json as pj
+
+from LoadData import file_path, iter_json_lines, to_float
+
+# Columns stored as {'$date': ms} in the exports
+date_columns = {
+    "brands": [],
+    "receipts": ["createDate", "dateScanned", "finishedDate", "modifyDate", "pointsAwardedDate", "purchaseDate"],
+    "users": ["createdDate", "lastLogin"],
+    "rewards_items": [],
+}
+
+# Columns stored as strings or mixed types in the exports that hold numbers, mixed types are read by
+# read_json_records
+numeric_columns = {
+    "brands": [],
+    "receipts": ["bonusPointsEarned", "pointsEarned", "purchasedItemCount", "totalSpent"],
+    "users": [],
+    "rewards_items": ["discountedItemPrice", "finalPrice", "itemPrice", "originalFinalPrice",
+                      "originalMetaBriteItemPrice", "originalMetaBriteQuantityPurchased", "pointsEarned",
+                      "priceAfterCoupon", "quantityPurchased", "targetPrice", "userFlaggedPrice",
+                      "userFlaggedQuantity"],
+}
+
+# Numeric columns checked for negative values, as in DataQualityAnalysis.py
+negative_checks = {
+    "receipts": ["totalSpent", "purchasedItemCount", "bonusPointsEarned", "pointsEarned"],
+    "rewards_items": ["itemPrice", "finalPrice", "quantityPurchased"],
+}
+
+# Strings the float cast accepts, anything else in a numeric column is treated as missing
+number_pattern = r"^[+-]?(\d+\.?\d*|\.\d+)([eE][+-]?\d+)?$"
+
+# Table and key column names used by FetchHomeWork.sql
+sql_names = {
+    "brands": ("brands", {"_id": "brands_id"}),
+    "receipts": ("receipts", {"_id": "receipts_id"}),
+    "users": ("users", {"_id": "users_id"}),
+    "rewards_items": ("ReceiptsRewardsReceiptItemList", {"receipt_id": "receipts_id"}),
+}
+
+
+# Decode one column of a record batch: {'$oid'} to string, {'$date'} to timestamp, string numbers to float
+def decode_column(table, name, column):
+    if pa.types.is_struct(column.type):
+        fields = [column.type.field(i).name for i in range(column.type.num_fields)]
+        if "$oid" in fields:
+            return pc.struct_field(column, "$oid")
+        if "$date" in fields:
+            return pc.struct_field(column, "$date").cast(pa.timestamp("ms"))
+        if "$id" in fields:
+            return pc.struct_field(pc.struct_field(column, "$id"), "$oid")
+    if name in date_columns[table] and pa.types.is_integer(column.type):
+        return column.cast(pa.timestamp("ms"))
+    if name in numeric_columns[table]:
+        if pa.types.is_string(column.type):
+            # Like pd.to_numeric(errors="coerce"): empty or unparseable strings become null instead of failing
+            column = pc.utf8_trim_whitespace(column)
+            numeric = pc.match_substring_regex(column, number_pattern)
+            column = pc.if_else(numeric, column, pa.scalar(None, pa.string()))
+        return column.cast(pa.float64())
+    return column
+
+
+def decode_batch(table, batch):
+    names = batch.schema.names
+    return pa.RecordBatch.from_arrays(
+        [decode_column(table, name, batch.column(name)) for name in names], names=names)
+
+
+# Unnest rewardsReceiptItemList of a receipts batch into an items batch linked by receipt_id
+def flatten_items_batch(batch):
+    item_lists = batch.column("rewardsReceiptItemList")
+    items = item_lists.flatten()
+    receipt_ids = pc.take(batch.column("_id"), pc.list_parent_indices(item_lists))
+    names = [items.type.field(i).name for i in range(items.type.num_fields)]
+    return pa.RecordBatch.from_arrays(items.flatten() + [receipt_ids], names=names + ["receipt_id"])
+
+
+# Raw JSON types of the columns, inferred from the first lines of an export
+def sample_schema(path, sample_lines=1000):
+    with open(path, "rb") as file:
+        sample = b"".join(itertools.islice(file, sample_lines))
+    return pj.read_json(io.BytesIO(sample)).schema
+
+
+# Widen a sampled type to one later rows can still fit: a field that was always null in the sample may
+# hold strings further down, and a top-level integer field may later hold 1.5
+def widen_field(field, top_level=True):
+    if pa.types.is_null(field.type):
+        return field.with_type(pa.string())
+    if top_level and pa.types.is_integer(field.type):
+        return field.with_type(pa.float64())
+    if pa.types.is_struct(field.type):
+        return field.with_type(pa.struct([widen_field(field.type.field(i), top_level=False)
+                                          for i in range(field.type.num_fields)]))
+    return field
+
+
+def coerce_numbers(record, columns):
+    return {name: to_float(value) if name in columns else value for name, value in record.items()}
+
+
+# Row by row read for exports the Arrow parser rejects, a numeric column that is a number in some rows and
+# a string in others ("totalSpent": 10.5 and "totalSpent": "10.50"). Numeric columns, including the ones
+# of receipt items, are converted with to_float first so every row has the same type
+def read_json_records(path, table, columns=None):
+    records = []
+    for record in iter_json_lines(path):
+        if columns is not None:
+            record = {name: record[name] for name in columns if name in record}
+        record = coerce_numbers(record, numeric_columns[table])
+        if isinstance(record.get("rewardsReceiptItemList"), list):
+            record["rewardsReceiptItemList"] = [coerce_numbers(item, numeric_columns["rewards_items"])
+                                                for item in record["rewardsReceiptItemList"]]
+        records.append(record)
+    return pa.Table.from_pylist(records)
+
+
+def read_all_columns(path, table, columns=None):
+    try:
+        raw = pj.read_json(path)
+    except pa.ArrowInvalid:
+        return read_json_records(path, table, columns)
+    return raw if columns is None else raw.select([name for name in columns if name in raw.column_names])
+
+
+# Read an export of `table` keeping only the given top-level columns. The parser is given an explicit schema
+# and ignores every other field, so large unused subtrees (rewardsReceiptItemList, long reason strings) are
+# never materialized
+def read_json_columns(path, table, columns=None):
+    if columns is None:
+        return read_all_columns(path, table)
+    columns = list(dict.fromkeys(columns))
+    sample = sample_schema(path)
+    if any(name not in sample.names or pa.types.is_list(sample.field(name).type) for name in columns):
+        # A column missing from the sample has no known type, and item fields first seen after the sample
+        # would be dropped from a list<struct> schema, so both fall back to full inference
+        return read_all_columns(path, table, columns)
+    schema = pa.schema([widen_field(sample.field(name)) for name in columns])
+    options = pj.ParseOptions(explicit_schema=schema, unexpected_field_behavior="ignore")
+    try:
+        return pj.read_json(path, parse_options=options)
+    except pa.ArrowInvalid:
+        # A value the sampled types can not hold (a string where the sample only had numbers)
+        return read_all_columns(path, table, columns)
+
+
+def select_columns(table, columns):
+    if columns is None:
+        return table
+    return table.select([name for name in dict.fromkeys(columns) if name in table.column_names])
+
+
+# Load brands, receipts, users and the flattened rewards items as decoded Arrow tables.
+# The exports are parsed straight into Arrow buffers, every other view (pandas, SQL) reads these buffers.
+# `columns` maps table name to the columns a check or query needs (None for all of them); tables left
+# out of the mapping are not loaded. rewards_items columns are read from receipts.json
+def load_arrow_tables(data_dir=None, columns=None):
+    wanted = columns or {name: None for name in ["brands", "users", "receipts", "rewards_items"]}
+    tables = {}
+    for name in ["brands", "users"]:
+        if name in wanted:
+            raw = read_json_columns(file_path(name, data_dir), name, wanted[name])
+            tables[name] = pa.Table.from_batches([decode_batch(name, batch) for batch in raw.to_batches()])
+
+    if "receipts" in wanted or "rewards_items" in wanted:
+        receipt_columns = wanted.get("receipts") if "receipts" in wanted else []
+        if "rewards_items" in wanted and receipt_columns is not None:
+            receipt_columns = receipt_columns + ["_id", "rewardsReceiptItemList"]
+        receipts, items = load_receipts_arrow(file_path("receipts", data_dir), receipt_columns)
+        if "receipts" in wanted:
+            tables["receipts"] = select_columns(receipts, wanted["receipts"])
+        if "rewards_items" in wanted:
+            item_columns = wanted["rewards_items"]
+            tables["rewards_items"] = select_columns(items, None if item_columns is None else item_columns + ["receipt_id"])
+    return tables
+
+
+# Load one receipts export (or a slice of one) as decoded receipts and rewards items Arrow tables
+def load_receipts_arrow(path, columns=None):
+    raw = read_json_columns(path, "receipts", columns)
+    receipts = [decode_batch("receipts", batch) for batch in raw.to_batches()]
+    if "rewardsReceiptItemList" not in raw.column_names:
+        return pa.Table.from_batches(receipts), pa.table({"receipt_id": pa.array([], pa.string())})
+    items = [decode_batch("rewards_items", flatten_items_batch(batch)) for batch in receipts]
+    return (pa.Table.from_batches(receipts).drop_columns(["rewardsReceiptItemList"]),
+            pa.Table.from_batches(items))
+
+
+# pandas views over the Arrow tables, ArrowDtype columns share the Arrow buffers instead of copying them
+def to_pandas(tables):
+    return {name: table.to_pandas(types_mapper=pd.ArrowDtype) for name, table in tables.items()}
+
+
+# Load the tables as pandas DataFrames backed by Arrow buffers
+def load_tables(data_dir=None, columns=None):
+    return to_pandas(load_arrow_tables(data_dir, columns))
+
+
+# Register the Arrow tables under the FetchHomeWork.sql table and key names in an embedded DuckDB connection.
+# DuckDB scans the registered Arrow buffers in place, nothing is copied into database rows.
+# A new connection can only see the registered tables: file, extension and attach access is disabled and
+# the setting is locked, so queries can not read or write files as the user running them
+def sql_connection(tables, connection=None):
+    try:
+        import duckdb
+    except ImportError as error:
+        raise ImportError("duckdb is required to run SQL over the loaded tables: pip install duckdb") from error
+
+    sandboxed = connection is None
+    if sandboxed:
+        connection = duckdb.connect(config={"enable_external_access": False})
+    for name, table in tables.items():
+        sql_name, renames = sql_names[name]
+        connection.register(sql_name, table.rename_columns([renames.get(c, c) for c in table.column_names]))
+    if sandboxed:
+        connection.execute("SET lock_configuration = true")
+    return connection
@@ -1,5 +1,6 @@
 import pandas as pd
 import os
+from ItemKeys import composite_key, duplicated_keys
 pd.set_option('display.max_columns', 10, 'display.width', 500)
 
 file_names = {
@@ -59,7 +60,7 @@ for name, count in duplicates.items():
     print(f"- {name.capitalize()}: {count}")
 
 
-def basic_data_checks(df, df_name):
+def basic_data_checks(df, df_name, key_columns=None):
     print(f"\n{'=' * 30} DATA QUALITY CHECKS FOR {df_name.capitalize()} {'=' * 30}")
 
     # Missing values
@@ -77,7 +78,13 @@ def basic_data_checks(df, df_name):
 
         # Count Duplicate IDs
         duplicate_ids_counts = df['_id'].astype(str).value_counts()
-        print(f"\nDuplicate {df_name.capitalize()} IDs Counts:\n{duplicate_ids_counts[duplicate_ids_counts > 1]}")
+        duplicate_ids_counts = duplicate_ids_counts[duplicate_ids_counts > 1]
+        if key_columns:
+            # Composite integer keys are shown as the column values they were built from
+            key_parts = df.assign(_key=df['_id'].astype(str)).drop_duplicates('_key').set_index('_key')[key_columns]
+            duplicate_ids_counts = key_parts.loc[duplicate_ids_counts.index].assign(count=duplicate_ids_counts.to_numpy())
+            duplicate_ids_counts = duplicate_ids_counts.reset_index(drop=True)
+        print(f"\nDuplicate {df_name.capitalize()} IDs Counts:\n{duplicate_ids_counts}")
 
         # Count NaN in IDs
         print(f"\nTotal NaN in {df_name.capitalize()} IDs \n{df['_id'].isna().sum()}")
@@ -599,25 +606,27 @@ Total Rewards_items: 6941
 Unique Rewards_items IDs: 2060
 Duplicate Rewards_items IDs: 4881
 Duplicate Rewards_items IDs Counts:
-_id
-600f2fc80a720f0535000030nan             303
-600f39c30a7214ada2000030nan             298
-600f24970a720f053500002fnan             286
-600f0cc70a720f053500002cnan             176
-600a1a8d0a7214ada2000008nan             163
-                                       ... 
-600f2fc80a720f0535000030511111704140      2
-60145a540a720f05f8000116nan               2
-601830cd0a720f05f800034fnan               2
-60189c920a7214ad2800003anan               2
-5ff1e1e90a7214ada1000569nan               2
-Name: count, Length: 503, dtype: int64
+                   receipt_id       barcode  count
+0    600f2fc80a720f0535000030           NaN    303
+1    600f39c30a7214ada2000030           NaN    298
+2    600f24970a720f053500002f           NaN    286
+3    600f0cc70a720f053500002c           NaN    176
+4    600a1a8d0a7214ada2000008           NaN    163
+..                        ...           ...    ...
+498  600f2fc80a720f0535000030  026800001924      2
+499  60132b890a7214ad50000013           NaN      2
+500  60145a540a720f05f8000116           NaN      2
+501  601830cd0a720f05f800034f           NaN      2
+502  60189c920a7214ad2800003a           NaN      2
+
+[503 rows x 3 columns]
 Total NaN in Rewards_items IDs 
 0
 """
 # Assuming receipt_id + barcode can be used as the unique identifier
-dataframes['rewards_items']['_id'] = dataframes['rewards_items']['receipt_id'].astype(str) + dataframes['rewards_items']['barcode'].astype(str)
-basic_data_checks(dataframes['rewards_items'], "rewards_items")
+# Integer composite key instead of concatenated strings, NaN barcodes form one group per receipt as before
+dataframes['rewards_items']['_id'] = composite_key(dataframes['rewards_items'], ['receipt_id', 'barcode'])
+basic_data_checks(dataframes['rewards_items'], "rewards_items", key_columns=['receipt_id', 'barcode'])
 
 # Check receipt with NaN barcodes
 # {'$oid': '600f2fc80a720f0535000030'} as example
@@ -644,7 +653,7 @@ Any duplicated rows?
 False
 Meaning receipt_id+barcode alone can not be used as the unique identifier, maybe use receipt_id + partnerItemID instead?
 """
-duplicated_ids_df = dataframes['rewards_items'][dataframes['rewards_items'].groupby('_id')['_id'].transform('count') > 1]
+duplicated_ids_df = dataframes['rewards_items'][duplicated_keys(dataframes['rewards_items']['_id'].to_numpy())]
 print(duplicated_ids_df[['receipt_id','barcode']].head())
 print(f"\n{len(duplicated_ids_df)} duplicated receipt_id+barcode")
 print(f"\nAny duplicated rows? \n{duplicated_ids_df.astype(str).value_counts()[duplicated_ids_df.astype(str).value_counts() > 1].any()}")
@@ -654,8 +663,8 @@ Any duplicated rows?
 False
 receipt_id + partnerItemID is unique
 """
-dataframes['rewards_items']['_id2'] = dataframes['rewards_items']['partnerItemId'].astype(str) + dataframes['rewards_items']['receipt_id'].astype(str)
-print(f"\nAny duplicated rows? \n{dataframes['rewards_items']['_id2'].value_counts()[dataframes['rewards_items']['_id2'].value_counts()>1].any()}")
+dataframes['rewards_items']['_id2'] = composite_key(dataframes['rewards_items'], ['partnerItemId', 'receipt_id'])
+print(f"\nAny duplicated rows? \n{duplicated_keys(dataframes['rewards_items']['_id2'].to_numpy()).any()}")
 """
                   receipt_id       barcode partnerItemId  quantityPurchased itemPrice finalPrice
 14  5ff1e1b60a7214ada100055c  034100573065             1                1.0        29         29
@@ -0,0 +1,242 @@
+import argparse
+import fnmatch
+import json
+import os
+import time
+from collections import Counter
+
+import pyarrow.compute as pc
+
+from ColumnarTables import load_receipts_arrow, negative_checks
+from LoadData import file_digest
+
+
+def column_sum(table, column, mask):
+    if column not in table.column_names:
+        return 0
+    return pc.sum(mask(table.column(column))).as_py() or 0
+
+
+# Running data-quality numbers, every field is additive so a new file is folded in without reprocessing
+class QualityAggregates:
+    def __init__(self):
+        self.rows = Counter()
+        self.present = {"receipts": Counter(), "rewards_items": Counter()}
+        self.statuses = Counter()
+        self.negative = {table: Counter() for table in negative_checks}
+        self.price_mismatches = 0
+        self.missing_review_reasons = 0
+
+    def add(self, receipts, items):
+        for table_name, table in [("receipts", receipts), ("rewards_items", items)]:
+            self.rows[table_name] += table.num_rows
+            for column in table.column_names:
+                self.present[table_name][column] += table.num_rows - table.column(column).null_count
+            for column in negative_checks[table_name]:
+                self.negative[table_name][column] += column_sum(table, column, lambda c: pc.less(c, 0))
+
+        if "rewardsReceiptStatus" in receipts.column_names:
+            for entry in pc.value_counts(receipts.column("rewardsReceiptStatus")).to_pylist():
+                self.statuses[entry["values"]] += entry["counts"]
+
+        if "itemPrice" in items.column_names and "finalPrice" in items.column_names:
+            self.price_mismatches += pc.sum(pc.not_equal(items.column("itemPrice"), items.column("finalPrice"))).as_py() or 0
+        if "needsFetchReview" in items.column_names:
+            reasons = items.column("needsFetchReviewReason") if "needsFetchReviewReason" in items.column_names else None
+            flagged = pc.equal(items.column("needsFetchReview"), True)
+            without_reason = pc.and_(flagged, pc.is_null(reasons)) if reasons is not None else flagged
+            self.missing_review_reasons += pc.sum(without_reason).as_py() or 0
+
+    # Missing value counts per column, a column absent from a file counts as missing for all its rows
+    def missing(self, table_name):
+        return {column: self.rows[table_name] - present for column, present in self.present[table_name].items()}
+
+    def summary(self):
+        return {
+            "rows": dict(self.rows),
+            "missing_pct": {table: {column: round(missing / self.rows[table] * 100, 4)
+                                    for column, missing in self.missing(table).items()}
+                            for table in self.present if self.rows[table]},
+            "statuses": dict(self.statuses),
+            "negative_values": {table: dict(counts) for table, counts in self.negative.items()},
+            "price_mismatches": self.price_mismatches,
+            "missing_review_reasons": self.missing_review_reasons,
+        }
+
+    def to_dict(self):
+        return {"rows": dict(self.rows),
+                "present": {table: dict(counts) for table, counts in self.present.items()},
+                "statuses": dict(self.statuses),
+                "negative": {table: dict(counts) for table, counts in self.negative.items()},
+                "price_mismatches": self.price_mismatches,
+                "missing_review_reasons": self.missing_review_reasons}
+
+    @classmethod
+    def from_dict(cls, data):
+        aggregates = cls()
+        aggregates.rows = Counter(data["rows"])
+        aggregates.present = {table: Counter(counts) for table, counts in data["present"].items()}
+        aggregates.statuses = Counter(data["statuses"])
+        aggregates.negative = {table: Counter(counts) for table, counts in data["negative"].items()}
+        aggregates.price_mismatches = data["price_mismatches"]
+        aggregates.missing_review_reasons = data["missing_review_reasons"]
+        return aggregates
+
+
+# Checkpoint manifest and aggregates kept in one state file, replaced atomically after each ingested file,
+# so a file is either fully counted and recorded or not at all
+class IngestState:
+    def __init__(self, path):
+        self.path = path
+        self.manifest = {}
+        self.aggregates = QualityAggregates()
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as file:
+                data = json.load(file)
+            self.manifest = data["manifest"]
+            self.aggregates = QualityAggregates.from_dict(data["aggregates"])
+
+    def save(self):
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as file:
+            json.dump({"manifest": self.manifest, "aggregates": self.aggregates.to_dict()}, file)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(tmp_path, self.path)
+
+
+class IngestDaemon:
+    def __init__(self, watch_dir, state_path=None, pattern="*.json", settle_seconds=2.0):
+        self.watch_dir = watch_dir
+        self.pattern = pattern
+        self.settle_seconds = settle_seconds
+        self.state = IngestState(state_path or os.path.join(watch_dir, ".ingest_state.json"))
+        self.ingested_digests = set()
+        for entry in self.state.manifest.values():
+            if "error" not in entry:
+                self.ingested_digests.add(entry["sha256"])
+            self.ingested_digests.update(entry.get("replaced", []))
+
+    def candidates(self):
+        state_name = os.path.basename(self.state.path)
+        for name in sorted(os.listdir(self.watch_dir)):
+            if name.startswith(state_name) or not fnmatch.fnmatch(name, self.pattern):
+                continue
+            path = os.path.join(self.watch_dir, name)
+            if os.path.isfile(path):
+                yield name, path
+
+    # Digest of a file whose content has not been recorded under its name yet, None when nothing is new.
+    # The file is only re-hashed when its size or mtime differ from the manifest, so a slice dropped again
+    # under a reused name (a fresh receipts.json) is picked up without hashing every file on every scan
+    def new_digest(self, name, path):
+        stat = os.stat(path)
+        if stat.st_size == 0:
+            return None
+        entry = self.state.manifest.get(name)
+        if entry and [entry.get("size"), entry.get("mtime_ns")] == [stat.st_size, stat.st_mtime_ns]:
+            return None
+        digest = file_digest(path)
+        if entry and entry["sha256"] == digest:
+            entry.update(size=stat.st_size, mtime_ns=stat.st_mtime_ns)
+            self.state.save()
+            return None
+        return digest
+
+    def record(self, name, path, digest, **fields):
+        stat = os.stat(path)
+        entry = {"sha256": digest, "size": stat.st_size, "mtime_ns": stat.st_mtime_ns,
+                 "ingested_at": time.time(), **fields}
+        previous = self.state.manifest.get(name)
+        if previous:
+            replaced = previous.get("replaced", []) + ([] if "error" in previous else [previous["sha256"]])
+            if replaced:
+                entry["replaced"] = replaced
+        self.state.manifest[name] = entry
+        self.state.save()
+
+    # Ingest each file content exactly once: the manifest is keyed by name, the content digest catches copies,
+    # renames and new content under a reused name. A file that fails to parse is recorded with its error so it
+    # is skipped on restart instead of crashing again, and retried once its content changes
+    def ingest(self, name, path):
+        digest = self.new_digest(name, path)
+        if digest is None:
+            return False
+        if digest in self.ingested_digests:
+            self.record(name, path, digest, duplicate=True)
+            return False
+
+        try:
+            receipts, items = load_receipts_arrow(path)
+        except Exception as error:
+            self.record(name, path, digest, error=f"{type(error).__name__}: {error}")
+            print(f"Failed to ingest {name}: {error}")
+            return False
+        self.state.aggregates.add(receipts, items)
+        self.record(name, path, digest, receipts=receipts.num_rows, items=items.num_rows)
+        self.ingested_digests.add(digest)
+        print(f"Ingested {name}: {receipts.num_rows} receipts, {items.num_rows} items")
+        return True
+
+    # Ingest every file that has not changed for settle_seconds (files still being written are picked up later)
+    def scan(self):
+        ingested = 0
+        now = time.time()
+        for name, path in self.candidates():
+            if now - os.path.getmtime(path) < self.settle_seconds:
+                continue
+            ingested += self.ingest(name, path)
+        return ingested
+
+    def unsettled(self):
+        now = time.time()
+        return any(now - os.path.getmtime(path) < self.settle_seconds for _, path in self.candidates())
+
+    def run_polling(self, interval):
+        while True:
+            if self.scan():
+                print(json.dumps(self.state.aggregates.summary()))
+            time.sleep(interval)
+
+    # inotify wakes the daemon instead of a polling interval. A producer may close the file several times while
+    # writing it, so events only trigger a scan and the settle time still applies; while a file is unsettled
+    # the read times out to scan it again once it has been quiet long enough
+    def run_inotify(self, inotify_simple):
+        inotify = inotify_simple.INotify()
+        flags = inotify_simple.flags
+        inotify.add_watch(self.watch_dir, flags.CLOSE_WRITE | flags.MOVED_TO)
+        self.scan()
+        while True:
+            timeout = int(self.settle_seconds * 1000) if self.unsettled() else None
+            inotify.read(timeout=timeout)
+            if self.scan():
+                print(json.dumps(self.state.aggregates.summary()))
+
+    def run(self, interval=5.0, use_inotify=True):
+        if use_inotify:
+            try:
+                import inotify_simple
+            except ImportError:
+                print("inotify_simple is not installed, falling back to polling")
+            else:
+                return self.run_inotify(inotify_simple)
+        return self.run_polling(interval)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Watch a drop directory and ingest new receipts files")
+    parser.add_argument("watch_dir", help="directory where receipts JSON slices land")
+    parser.add_argument("--state", default=None, help="checkpoint file, defaults to <watch_dir>/.ingest_state.json")
+    parser.add_argument("--pattern", default="*.json", help="file name pattern to ingest")
+    parser.add_argument("--interval", type=float, default=5.0, help="polling interval in seconds")
+    parser.add_argument("--poll", action="store_true", help="always poll instead of using inotify")
+    parser.add_argument("--once", action="store_true", help="ingest what is there now and exit")
+    args = parser.parse_args()
+
+    daemon = IngestDaemon(args.watch_dir, args.state, args.pattern)
+    if args.once:
+        daemon.settle_seconds = 0
+        daemon.scan()
+        print(json.dumps(daemon.state.aggregates.summary(), indent=2))
+    else:
+        daemon.run(args.interval, use_inotify=not args.poll)
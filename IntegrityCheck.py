@@ -0,0 +1,187 @@
+import argparse
+import heapq
+import json
+import os
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from LoadData import file_path, iter_json_lines, oid
+
+# Keys held in memory per column before a sorted run is spilled to disk. Exports under this size stay on the
+# hash path, larger ones switch to the sort-merge anti-join without any flag
+default_spill_rows = 1_000_000
+
+
+# Collect the keys of one side of a relationship, spilling sorted runs to disk once the buffer is full
+class KeyColumn:
+    def __init__(self, spill_rows=default_spill_rows, tmp_dir=None):
+        self.spill_rows = spill_rows
+        self.tmp_dir = tmp_dir
+        self.buffer = []
+        self.runs = []
+        self.rows = 0
+        self.nulls = 0
+
+    def append(self, key):
+        self.rows += 1
+        if key is None or key == "":
+            self.nulls += 1
+            return
+        self.buffer.append(str(key))
+        if self.spill_rows and len(self.buffer) >= self.spill_rows:
+            self.spill()
+
+    # Write the buffer as a sorted run, one JSON encoded key per line
+    def spill(self):
+        run = tempfile.NamedTemporaryFile("w", encoding="utf-8", suffix=".keys", dir=self.tmp_dir, delete=False)
+        with run:
+            for key in sorted(self.buffer):
+                run.write(json.dumps(key) + "\n")
+        self.runs.append(run.name)
+        self.buffer = []
+
+    @property
+    def spilled(self):
+        return len(self.runs) > 0
+
+    # Iterate all keys in sorted order by merging the runs with the in-memory buffer
+    def sorted_keys(self):
+        files = [open(path, "r", encoding="utf-8") for path in self.runs]
+        try:
+            streams = [(json.loads(line) for line in file) for file in files]
+            streams.append(iter(sorted(self.buffer)))
+            yield from heapq.merge(*streams)
+        finally:
+            for file in files:
+                file.close()
+
+    def cleanup(self):
+        for path in self.runs:
+            os.remove(path)
+        self.runs = []
+
+
+# Hash semi-join on factorized integer keys: returns the child keys that have no parent
+def hash_orphans(child_keys, parent_keys):
+    parent = np.asarray(parent_keys, dtype=object)
+    child = np.asarray(child_keys, dtype=object)
+    codes, uniques = pd.factorize(np.concatenate([parent, child]))
+    present = np.zeros(len(uniques), dtype=bool)
+    present[codes[:len(parent)]] = True
+    return child[~present[codes[len(parent):]]]
+
+
+# Sort-merge anti-join over two sorted key streams, for inputs that do not fit in memory
+def merge_orphans(sorted_child_keys, sorted_parent_keys):
+    parents = iter(sorted_parent_keys)
+    parent = next(parents, None)
+    for key in sorted_child_keys:
+        while parent is not None and parent < key:
+            parent = next(parents, None)
+        if parent is None or parent != key:
+            yield key
+
+
+# Each relationship of RelationalDiagram: (name, child table, child column, parent table, parent column)
+relationships = [
+    ("users -> receipts (userId)", "receipts", "userId", "users", "_id"),
+    ("receipts -> items (receipt_id)", "items", "receipt_id", "receipts", "_id"),
+    ("items -> brands (brandCode)", "items", "brandCode", "brands", "brandCode"),
+    ("items -> brands (barcode)", "items", "barcode", "brands", "barcode"),
+]
+
+
+# Scan each export once and collect the key columns of every relationship
+def collect_keys(data_dir=None, spill_rows=default_spill_rows, tmp_dir=None):
+    columns = {}
+    for _, child_table, child_column, parent_table, parent_column in relationships:
+        for table, column in [(child_table, child_column), (parent_table, parent_column)]:
+            if (table, column) not in columns:
+                columns[(table, column)] = KeyColumn(spill_rows, tmp_dir)
+
+    def wanted(table):
+        return [(column, key_column) for (name, column), key_column in columns.items() if name == table]
+
+    for table in ["users", "brands", "receipts"]:
+        table_columns = wanted(table)
+        item_columns = wanted("items") if table == "receipts" else []
+        for record in iter_json_lines(file_path(table, data_dir)):
+            for column, key_column in table_columns:
+                key_column.append(oid(record.get(column)))
+            if not item_columns:
+                continue
+            receipt_id = oid(record.get("_id"))
+            for item in record.get("rewardsReceiptItemList") or []:
+                for column, key_column in item_columns:
+                    key_column.append(receipt_id if column == "receipt_id" else item.get(column))
+    return columns
+
+
+# Validate every foreign key of the diagram in one job and report orphan counts with sample ids
+def check_integrity(data_dir=None, spill_rows=default_spill_rows, tmp_dir=None, sample_size=5):
+    columns = collect_keys(data_dir, spill_rows, tmp_dir)
+    report = []
+    try:
+        for name, child_table, child_column, parent_table, parent_column in relationships:
+            child = columns[(child_table, child_column)]
+            parent = columns[(parent_table, parent_column)]
+            if child.spilled or parent.spilled:
+                method = "sort-merge"
+                orphans = merge_orphans(child.sorted_keys(), parent.sorted_keys())
+            else:
+                method = "hash"
+                orphans = hash_orphans(child.buffer, parent.buffer)
+
+            orphan_rows = 0
+            distinct = set() if method == "hash" else None
+            distinct_count = 0
+            previous = None
+            sample = []
+            for key in orphans:
+                orphan_rows += 1
+                if distinct is not None:
+                    if key in distinct:
+                        continue
+                    distinct.add(key)
+                elif key == previous:
+                    continue
+                previous = key
+                distinct_count += 1
+                if len(sample) < sample_size:
+                    sample.append(key)
+
+            report.append({
+                "relationship": name,
+                "method": method,
+                "child_rows": child.rows,
+                "null_keys": child.nulls,
+                "orphan_rows": orphan_rows,
+                "orphan_distinct": distinct_count,
+                "sample_orphans": sample,
+            })
+    finally:
+        for key_column in columns.values():
+            key_column.cleanup()
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check every foreign key of RelationalDiagram")
+    parser.add_argument("--data-dir", default=None, help="directory holding the JSON exports")
+    parser.add_argument("--spill-rows", type=int, default=default_spill_rows,
+                        help="spill sorted key runs to disk every N keys and use sort-merge, 0 keeps all keys in memory")
+    parser.add_argument("--tmp-dir", default=None, help="directory for the spilled key runs")
+    parser.add_argument("--output", default=None, help="write the report as JSON to this file")
+    args = parser.parse_args()
+
+    report = check_integrity(args.data_dir, args.spill_rows, args.tmp_dir)
+    for row in report:
+        print(f"\n{row['relationship']} [{row['method']}]")
+        print(f"Child rows: {row['child_rows']}, NaN keys: {row['null_keys']}")
+        print(f"Orphan rows: {row['orphan_rows']}, distinct orphan keys: {row['orphan_distinct']}")
+        print(f"Sample orphans: {row['sample_orphans']}")
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            json.dump(report, file, indent=2)
@@ -0,0 +1,57 @@
+import numpy as np
+import pandas as pd
+
+# Candidate identifiers of a rewards item
+item_key_columns = {
+    "receipt_id+barcode": ["receipt_id", "barcode"],
+    "receipt_id+partnerItemId": ["receipt_id", "partnerItemId"],
+}
+
+
+# Integer codes of one column, 0 is reserved for missing values so NaN barcodes still form one group
+def factorize_column(values):
+    codes, uniques = pd.factorize(values)
+    return codes.astype(np.int64) + 1, len(uniques) + 1
+
+
+# Composite key of several columns: their codes packed into one int64 when the bit widths fit in 63 bits,
+# otherwise a structured array with one int64 field per column. Unlike string concatenation the parts
+# can not run into each other, so equal keys always mean equal column values
+def composite_key(df, columns):
+    coded = [factorize_column(df[column]) for column in columns]
+    widths = [max(1, (cardinality - 1).bit_length()) for _, cardinality in coded]
+    if sum(widths) <= 63:
+        key = np.zeros(len(df), dtype=np.int64)
+        for (codes, _), width in zip(coded, widths):
+            key = (key << width) | codes
+        return key
+
+    key = np.empty(len(df), dtype=[(column, np.int64) for column in columns])
+    for column, (codes, _) in zip(columns, coded):
+        key[column] = codes
+    return key
+
+
+# Size of the key group each row belongs to, the integer version of groupby(key).transform('count')
+def group_sizes(keys):
+    _, inverse, counts = np.unique(keys, return_inverse=True, return_counts=True)
+    return counts[inverse.reshape(-1)]
+
+
+def duplicated_keys(keys):
+    return group_sizes(keys) > 1
+
+
+# Uniqueness of each candidate item identifier
+def item_key_report(items):
+    report = {}
+    for name, columns in item_key_columns.items():
+        keys = composite_key(items, columns)
+        sizes = group_sizes(keys)
+        report[name] = {
+            "rows": len(items),
+            "unique_keys": int(len(np.unique(keys))),
+            "rows_in_duplicate_groups": int((sizes > 1).sum()),
+            "largest_group": int(sizes.max()) if len(sizes) else 0,
+        }
+    return report
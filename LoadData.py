@@ -0,0 +1,77 @@
+import hashlib
+import json
+import os
+
+file_names = {
+    "brands": "brands.json",
+    "receipts": "receipts.json",
+    "users": "users.json"
+}
+
+
+# Build the full path of an export, defaulting to the current working directory
+def file_path(name, data_dir=None):
+    return os.path.join(data_dir or os.getcwd(), file_names[name])
+
+
+# Content digest of a file, read in blocks so large exports are never held in memory
+def file_digest(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        for block in iter(lambda: file.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+# Stream a newline-delimited JSON export one record at a time
+def iter_json_lines(path):
+    with open(path, "r", encoding="utf-8") as file:
+        for line in file:
+            if line.strip():
+                yield json.loads(line)
+
+
+# Read a newline-delimited JSON export into a list of dicts
+def read_json_lines(path):
+    return list(iter_json_lines(path))
+
+
+# Load one of the three exports by name ("brands", "receipts" or "users")
+def load_records(name, data_dir=None):
+    return read_json_lines(file_path(name, data_dir))
+
+
+# Extract the id string from {'$oid': ...}, plain strings are returned as is
+def oid(value):
+    if isinstance(value, dict):
+        return value.get("$oid")
+    return value
+
+
+# Extract epoch milliseconds from {'$date': ...}, None when the date is missing
+def date_ms(value):
+    if isinstance(value, dict):
+        return value.get("$date")
+    return None
+
+
+# Convert the string-encoded numbers in the exports ("10.00", "5.0") to float, None when missing
+def to_float(value):
+    if value is None or value == "":
+        return None
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+# Flatten rewardsReceiptItemList into one row per item, linking each item to its receipt
+def flatten_items(receipts):
+    items_list = []
+    for receipt in receipts:
+        receipt_id = oid(receipt.get("_id"))
+        for item in receipt.get("rewardsReceiptItemList") or []:
+            row = dict(item)
+            row["receipt_id"] = receipt_id
+            items_list.append(row)
+    return items_list
@@ -0,0 +1,351 @@
+import argparse
+import json
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlencode, urlparse
+
+import pandas as pd
+import pyarrow as pa
+
+from AnomalyDetection import anomaly_columns, anomaly_summary, detect_anomalies
+from CohortIndex import CohortIndex
+from ColumnarTables import load_arrow_tables, load_tables, negative_checks, sql_connection, to_pandas
+from IntegrityCheck import hash_orphans
+from ItemKeys import item_key_report
+from LoadData import file_names, file_path
+from ResultCache import ResultCache, normalize_query, sql_sources, table_sources
+
+
+# Tables loaded once and kept in memory, reloaded when a source file changes
+class WarmTables:
+    def __init__(self, data_dir=None):
+        self.data_dir = data_dir
+        self.lock = threading.Lock()
+        self.mtimes = None
+        self.arrow_tables = None
+        self.tables = None
+        self.loaded_at = None
+
+    def source_mtimes(self):
+        return {name: os.stat(file_path(name, self.data_dir)).st_mtime_ns for name in file_names}
+
+    def get(self):
+        mtimes = self.source_mtimes()
+        if mtimes != self.mtimes:
+            with self.lock:
+                if mtimes != self.mtimes:
+                    self.arrow_tables = load_arrow_tables(self.data_dir)
+                    self.tables = to_pandas(self.arrow_tables)
+                    self.mtimes = mtimes
+                    self.loaded_at = time.time()
+        return self.tables
+
+    def get_arrow(self):
+        self.get()
+        return self.arrow_tables
+
+
+# Missing values per column of one table
+def missing_values(tables, table="receipts"):
+    df = tables[table]
+    return {"rows": len(df),
+            "missing": df.isnull().sum().to_dict(),
+            "missing_pct": (df.isnull().mean() * 100).round(4).to_dict()}
+
+
+# Duplicated rows and ids per table
+def duplicates(tables):
+    result = {}
+    for name, df in tables.items():
+        row = {"duplicate_rows": int(df.astype(str).duplicated().sum())}
+        if "_id" in df.columns:
+            row["unique_ids"] = int(df["_id"].nunique())
+            row["duplicate_ids"] = int(df["_id"].duplicated().sum())
+        result[name] = row
+    return result
+
+
+# Negative values in the numeric columns checked by DataQualityAnalysis.py
+def negative_values(tables):
+    return {table: {column: int((tables[table][column] < 0).sum()) for column in columns}
+            for table, columns in negative_checks.items()}
+
+
+# Uniqueness of receipt_id+barcode and receipt_id+partnerItemId as item identifiers
+def item_keys(tables):
+    return item_key_report(tables["rewards_items"])
+
+
+# Items where itemPrice != finalPrice. The total counts a missing price as a mismatch like the NaN comparison
+# in DataQualityAnalysis.py (178), the narrower count only compares items that have both prices
+def price_mismatches(tables):
+    items = tables["rewards_items"]
+    differs = items["itemPrice"].ne(items["finalPrice"])
+    return {"total_mismatched_prices": int(differs.fillna(True).sum()),
+            "mismatched_with_both_prices": int(differs.fillna(False).sum())}
+
+
+# Price, quantity and points outliers per brand and category
+def anomalies(tables):
+    return anomaly_summary(detect_anomalies(tables["rewards_items"], tables["brands"]))
+
+
+# Can barcode or brandCode be used as the join key between items and brands?
+def join_key_coverage(tables):
+    result = {}
+    for key in ["barcode", "brandCode"]:
+        receipt_values = set(tables["rewards_items"][key].dropna())
+        brand_values = set(tables["brands"][key].dropna())
+        result[key] = {"matching": len(receipt_values & brand_values),
+                       "unique_in_receipts": len(receipt_values),
+                       "unique_in_brands": len(brand_values)}
+    return result
+
+
+# Orphan counts for every relationship of RelationalDiagram
+def integrity(tables):
+    checks = [
+        ("users -> receipts (userId)", tables["receipts"]["userId"], tables["users"]["_id"]),
+        ("receipts -> items (receipt_id)", tables["rewards_items"]["receipt_id"], tables["receipts"]["_id"]),
+        ("items -> brands (brandCode)", tables["rewards_items"]["brandCode"], tables["brands"]["brandCode"]),
+        ("items -> brands (barcode)", tables["rewards_items"]["barcode"], tables["brands"]["barcode"]),
+    ]
+    result = {}
+    for name, child, parent in checks:
+        orphans = hash_orphans(child.dropna().to_numpy(), parent.dropna().to_numpy())
+        result[name] = {"orphan_rows": len(orphans), "orphan_distinct": len(set(orphans))}
+    return result
+
+
+# Items joined to receipts and to brands on brandCode, as in FetchHomeWork.sql
+def brand_items(tables):
+    items = tables["rewards_items"][["receipt_id", "brandCode", "quantityPurchased", "finalPrice"]]
+    receipts = tables["receipts"][["_id", "userId", "dateScanned"]].rename(columns={"_id": "receipt_id"})
+    brands = tables["brands"][["brandCode", "name"]].dropna(subset=["brandCode"])
+    return items.merge(receipts, on="receipt_id").merge(brands, on="brandCode")
+
+
+# What are the top 5 brands by receipts scanned for most recent month?
+def top_brands_recent_month(tables, limit=5):
+    joined = brand_items(tables)
+    month = joined["dateScanned"].dt.strftime("%Y-%m")
+    recent = tables["receipts"]["dateScanned"].max().strftime("%Y-%m")
+    counts = joined[month == recent].groupby("name")["receipt_id"].nunique()
+    return {"month": recent,
+            "brands": counts.sort_values(ascending=False).head(int(limit)).to_dict()}
+
+
+# How does the ranking of the top 5 brands for the recent month compare to the previous month?
+def top_brands_ranking(tables, limit=5):
+    joined = brand_items(tables)
+    joined["month"] = joined["dateScanned"].dt.strftime("%Y-%m")
+    months = sorted(joined["month"].unique(), reverse=True)[:2]
+    counts = joined[joined["month"].isin(months)].groupby(["month", "name"])["receipt_id"].nunique()
+    ranks = counts.groupby(level="month").rank(method="min", ascending=False)
+    recent = ranks.loc[months[0]].sort_values()
+    recent = recent[recent <= int(limit)]
+    previous = ranks.loc[months[1]] if len(months) > 1 else pd.Series(dtype=float)
+    return {"recent_month": months[0],
+            "previous_month": months[1] if len(months) > 1 else None,
+            "ranking": [{"brand_name": name, "recent_ranking": int(rank),
+                         "previous_ranking": int(previous[name]) if name in previous.index else None}
+                        for name, rank in recent.items()]}
+
+
+def status_filter(tables, statuses):
+    receipts = tables["receipts"]
+    wanted = [status.strip().lower() for status in statuses.split(",")]
+    return receipts[receipts["rewardsReceiptStatus"].str.lower().isin(wanted)]
+
+
+# Average spend per rewardsReceiptStatus, 'Accepted' vs 'Rejected' by default
+def average_spend_by_status(tables, statuses="accepted,rejected"):
+    receipts = status_filter(tables, statuses)
+    spend = receipts.groupby(receipts["rewardsReceiptStatus"].str.upper())["totalSpent"].mean()
+    return spend.sort_values(ascending=False).to_dict()
+
+
+# Total number of items purchased per rewardsReceiptStatus
+def items_purchased_by_status(tables, statuses="accepted,rejected"):
+    receipts = status_filter(tables, statuses)
+    items = receipts.groupby(receipts["rewardsReceiptStatus"].str.upper())["purchasedItemCount"].sum()
+    return items.sort_values(ascending=False).to_dict()
+
+
+# CohortIndex of the loaded users table, rebuilt only when the warm tables are reloaded
+cohort_cache = {}
+
+
+def cohort_index(users):
+    cached = cohort_cache.get("users")
+    if cached is None or cached[0] is not users:
+        created_ms = users["createdDate"].astype(pd.ArrowDtype(pa.int64()))
+        cached = (users, CohortIndex.from_columns(users["_id"].tolist(), created_ms.tolist()))
+        cohort_cache["users"] = cached
+    return cached[1]
+
+
+# Largest value first, ties broken by brand name as in CohortIndex.ranked
+def top_values(series, limit):
+    return series.sort_index().sort_values(ascending=False, kind="stable").head(int(limit)).to_dict()
+
+
+# Items of receipts from users created within the past N months, the user set comes from the cohort index
+def recent_user_items(tables, months, now):
+    now = pd.Timestamp(now, tz="UTC").to_pydatetime() if now else None
+    recent_users = cohort_index(tables["users"]).users_created_since(int(months), now)
+    joined = brand_items(tables)
+    return joined[joined["userId"].isin(list(recent_users))]
+
+
+# Which brand has the most spend among users who were created within the past N months?
+def brand_spend_recent_users(tables, months=6, now=None, limit=5):
+    joined = recent_user_items(tables, months, now)
+    spend = (joined["quantityPurchased"] * joined["finalPrice"]).groupby(joined["name"]).sum()
+    return top_values(spend, limit)
+
+
+# Which brand has the most transactions among users who were created within the past N months?
+def brand_transactions_recent_users(tables, months=6, now=None, limit=5):
+    joined = recent_user_items(tables, months, now)
+    counts = joined.groupby("name")["receipt_id"].nunique()
+    return top_values(counts, limit)
+
+
+# Brand spend per monthly signup cohort of the users, {cohort: {brand: spend}}
+def brand_spend_by_cohort(tables):
+    joined = brand_items(tables)
+    cohorts = joined["userId"].map(cohort_index(tables["users"]).cohorts)
+    spend = (joined["quantityPurchased"] * joined["finalPrice"]).groupby([cohorts, joined["name"]]).sum()
+    return {cohort: top_values(spend.loc[cohort], len(spend)) for cohort in spend.index.get_level_values(0).unique()}
+
+
+endpoints = {
+    "/checks/missing": missing_values,
+    "/checks/duplicates": duplicates,
+    "/checks/negative": negative_values,
+    "/checks/item-keys": item_keys,
+    "/checks/price-mismatch": price_mismatches,
+    "/checks/anomalies": anomalies,
+    "/coverage": join_key_coverage,
+    "/integrity": integrity,
+    "/questions/top-brands-recent-month": top_brands_recent_month,
+    "/questions/top-brands-ranking": top_brands_ranking,
+    "/questions/average-spend-by-status": average_spend_by_status,
+    "/questions/items-purchased-by-status": items_purchased_by_status,
+    "/questions/brand-spend-recent-users": brand_spend_recent_users,
+    "/questions/brand-transactions-recent-users": brand_transactions_recent_users,
+    "/questions/brand-spend-by-cohort": brand_spend_by_cohort,
+}
+
+# Columns each endpoint reads. They key and invalidate its cached results by source export, and a one-off
+# --run only parses these columns. Endpoints not listed read every table
+brand_question_columns = {
+    "receipts": ["_id", "userId", "dateScanned"],
+    "rewards_items": ["brandCode", "quantityPurchased", "finalPrice"],
+    "brands": ["brandCode", "name"],
+}
+endpoint_columns = {
+    "/checks/negative": negative_checks,
+    "/checks/item-keys": {"rewards_items": ["barcode", "partnerItemId"]},
+    "/checks/price-mismatch": {"rewards_items": ["itemPrice", "finalPrice"]},
+    "/checks/anomalies": anomaly_columns,
+    "/coverage": {"rewards_items": ["barcode", "brandCode"], "brands": ["barcode", "brandCode"]},
+    "/questions/top-brands-recent-month": brand_question_columns,
+    "/questions/top-brands-ranking": brand_question_columns,
+    "/questions/average-spend-by-status": {"receipts": ["rewardsReceiptStatus", "totalSpent"]},
+    "/questions/items-purchased-by-status": {"receipts": ["rewardsReceiptStatus", "purchasedItemCount"]},
+    "/questions/brand-spend-recent-users": {**brand_question_columns, "users": ["_id", "createdDate"]},
+    "/questions/brand-transactions-recent-users": {**brand_question_columns, "users": ["_id", "createdDate"]},
+    "/questions/brand-spend-by-cohort": {**brand_question_columns, "users": ["_id", "createdDate"]},
+}
+
+
+def endpoint_sources(path):
+    if path not in endpoint_columns:
+        return list(file_names)
+    return sorted({table_sources[table] for table in endpoint_columns[path]})
+
+
+# Endpoints whose answer depends on the current date when no `now` is given
+dated_endpoints = {"/questions/brand-spend-recent-users", "/questions/brand-transactions-recent-users"}
+
+
+# Run a single read-only SELECT, anything else sent to /sql is refused before it reaches DuckDB
+def run_select(connection, query):
+    import duckdb
+
+    statements = connection.extract_statements(query)
+    if len(statements) != 1 or statements[0].type != duckdb.StatementType.SELECT:
+        raise ValueError("/sql only runs a single SELECT statement")
+    return connection.sql(query).to_arrow_table()
+
+
+def make_handler(warm, cache):
+    class QueryHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            started = time.perf_counter()
+            url = urlparse(self.path)
+            params = {key: values[-1] for key, values in parse_qs(url.query).items()}
+            if url.path in dated_endpoints and "now" not in params:
+                params["now"] = time.strftime("%Y-%m-%d", time.gmtime())
+
+            status, payload = 200, None
+            if url.path == "/":
+                payload = json.dumps({"endpoints": sorted(endpoints), "loaded_at": warm.loaded_at})
+            elif url.path == "/sql":
+                try:
+                    query = params["q"]
+                    payload = cache.get_or_compute(
+                        f"sql:{normalize_query(query)}", sql_sources(query),
+                        lambda: json.dumps(run_select(sql_connection(warm.get_arrow()), query).to_pylist(),
+                                           default=str))
+                except Exception as error:
+                    status, payload = 400, json.dumps({"error": str(error)})
+            elif url.path in endpoints:
+                try:
+                    payload = cache.get_or_compute(
+                        f"{url.path}?{urlencode(sorted(params.items()))}",
+                        endpoint_sources(url.path),
+                        lambda: json.dumps(endpoints[url.path](warm.get(), **params), default=str))
+                except (KeyError, TypeError, ValueError) as error:
+                    status, payload = 400, json.dumps({"error": str(error)})
+            else:
+                status, payload = 404, json.dumps({"error": f"unknown endpoint {url.path}"})
+
+            payload = payload.encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.send_header("X-Elapsed-Ms", f"{(time.perf_counter() - started) * 1000:.1f}")
+            self.end_headers()
+            self.wfile.write(payload)
+
+    return QueryHandler
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve the data-quality checks and SQL questions from warm tables")
+    parser.add_argument("--data-dir", default=None, help="directory holding the JSON exports")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--cache-dir", default=".query_cache", help="directory of the on-disk result cache")
+    parser.add_argument("--run", default=None,
+                        help="answer one endpoint, e.g. '/checks/negative', loading only its columns, and exit")
+    args = parser.parse_args()
+
+    if args.run:
+        url = urlparse(args.run)
+        params = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        tables = load_tables(args.data_dir, endpoint_columns.get(url.path))
+        print(json.dumps(endpoints[url.path](tables, **params), default=str, indent=2))
+        raise SystemExit
+
+    warm = WarmTables(args.data_dir)
+    warm.get()
+    cache = ResultCache(args.cache_dir, args.data_dir)
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(warm, cache))
+    print(f"Serving {len(endpoints)} endpoints on http://{args.host}:{args.port}")
+    server.serve_forever()
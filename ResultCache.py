@@ -0,0 +1,106 @@
+import hashlib
+import json
+import os
+import re
+import threading
+from collections import OrderedDict
+
+from LoadData import file_digest, file_names, file_path
+
+# Source export of each loaded table, the flattened items come from receipts.json
+table_sources = {
+    "brands": "brands",
+    "receipts": "receipts",
+    "users": "users",
+    "rewards_items": "receipts",
+    "ReceiptsRewardsReceiptItemList": "receipts",
+}
+
+
+# Strip comments and collapse whitespace so formatting changes of the same SQL hit the same entry.
+# Case is kept, string literals like 'FINISHED' are case sensitive
+def normalize_query(text):
+    text = re.sub(r"/\*.*?\*/", " ", text, flags=re.S)
+    text = re.sub(r"--[^\n]*", " ", text)
+    return " ".join(text.split()).rstrip(";")
+
+
+# Source exports a SQL query reads, every export when no known table name appears in it
+def sql_sources(text):
+    found = {source for table, source in table_sources.items()
+             if re.search(rf"\b{re.escape(table)}\b", text, flags=re.I)}
+    return sorted(found or file_names)
+
+
+# Results keyed by a normalized query or check id plus the content fingerprints of its source exports.
+# Recently used entries are kept in memory (LRU), every entry is also written to cache_dir
+class ResultCache:
+    def __init__(self, cache_dir=".query_cache", data_dir=None, max_entries=256):
+        self.cache_dir = cache_dir
+        self.data_dir = data_dir
+        self.max_entries = max_entries
+        self.memory = OrderedDict()
+        self.fingerprints = {}
+        self.lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+
+    # Content digest of an export, only recomputed when its size or mtime changes
+    def fingerprint(self, source):
+        stat = os.stat(file_path(source, self.data_dir))
+        stat_key = (stat.st_size, stat.st_mtime_ns)
+        cached = self.fingerprints.get(source)
+        if cached and cached[0] == stat_key:
+            return cached[1]
+        digest = file_digest(file_path(source, self.data_dir))
+        self.fingerprints[source] = (stat_key, digest)
+        if cached is None or cached[1] != digest:
+            self.invalidate(source, digest)
+        return digest
+
+    # Drop every entry built from an older version of the export
+    def invalidate(self, source, current_digest):
+        for key, entry in list(self.memory.items()):
+            if entry["sources"].get(source, current_digest) != current_digest:
+                del self.memory[key]
+        for name in os.listdir(self.cache_dir):
+            path = os.path.join(self.cache_dir, name)
+            try:
+                with open(path, "r", encoding="utf-8") as file:
+                    sources = json.load(file)["sources"]
+            except (OSError, ValueError, KeyError):
+                continue
+            if sources.get(source, current_digest) != current_digest:
+                os.remove(path)
+
+    def entry_path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+    def remember(self, key, entry):
+        self.memory[key] = entry
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.max_entries:
+            self.memory.popitem(last=False)
+
+    # Return the cached value of query_id over the given sources, computing and storing it on a miss
+    def get_or_compute(self, query_id, sources, compute):
+        with self.lock:
+            fingerprints = {source: self.fingerprint(source) for source in sorted(set(sources))}
+            key = hashlib.sha256(json.dumps([query_id, fingerprints]).encode("utf-8")).hexdigest()
+            if key in self.memory:
+                self.memory.move_to_end(key)
+                return self.memory[key]["value"]
+            if os.path.exists(self.entry_path(key)):
+                with open(self.entry_path(key), "r", encoding="utf-8") as file:
+                    entry = json.load(file)
+                self.remember(key, entry)
+                return entry["value"]
+
+        value = compute()
+        entry = {"query": query_id, "sources": fingerprints, "value": value}
+        with self.lock:
+            self.remember(key, entry)
+            tmp_path = f"{self.entry_path(key)}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as file:
+                json.dump(entry, file)
+            os.replace(tmp_path, self.entry_path(key))
+        return value
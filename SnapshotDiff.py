@@ -0,0 +1,108 @@
+import argparse
+import hashlib
+import json
+import os
+import tempfile
+from collections import Counter
+
+from LoadData import file_names, file_path, iter_json_lines, oid
+
+
+def fingerprint(value):
+    canonical = json.dumps(value, sort_keys=True, separators=(",", ":"))
+    return hashlib.blake2b(canonical.encode("utf-8"), digest_size=8).hexdigest()
+
+
+def partition_of(record_id, partitions):
+    return int.from_bytes(hashlib.blake2b(record_id.encode("utf-8"), digest_size=4).digest(), "big") % partitions
+
+
+# Stream one export into partition files of [id, record fingerprint, {field: fingerprint}] rows
+def partition_snapshot(path, out_dir, partitions):
+    files = [open(os.path.join(out_dir, f"part_{i:04d}.jsonl"), "w", encoding="utf-8") for i in range(partitions)]
+    try:
+        for record in iter_json_lines(path):
+            record_id = oid(record.get("_id"))
+            fields = {field: fingerprint(value) for field, value in record.items() if field != "_id"}
+            row = [record_id, fingerprint(fields), fields]
+            files[partition_of(str(record_id), partitions)].write(json.dumps(row) + "\n")
+    finally:
+        for file in files:
+            file.close()
+
+
+def read_partition(path):
+    with open(path, "r", encoding="utf-8") as file:
+        for line in file:
+            yield json.loads(line)
+
+
+# Compare two partitioned snapshots one partition at a time, so memory is bounded by the largest partition
+def diff_partitions(old_dir, new_dir, partitions):
+    inserted, updated, deleted = [], [], []
+    field_changes = Counter()
+    duplicate_ids = Counter()
+    for i in range(partitions):
+        name = f"part_{i:04d}.jsonl"
+        old = {}
+        for record_id, record_fp, fields in read_partition(os.path.join(old_dir, name)):
+            if record_id in old:
+                duplicate_ids["old"] += 1
+                continue
+            old[record_id] = (record_fp, fields)
+
+        seen = set()
+        for record_id, record_fp, fields in read_partition(os.path.join(new_dir, name)):
+            if record_id in seen:
+                duplicate_ids["new"] += 1
+                continue
+            seen.add(record_id)
+            if record_id not in old:
+                inserted.append(record_id)
+                continue
+            old_fp, old_fields = old.pop(record_id)
+            if old_fp == record_fp:
+                continue
+            updated.append(record_id)
+            for field in set(old_fields) | set(fields):
+                if old_fields.get(field) != fields.get(field):
+                    field_changes[field] += 1
+        deleted.extend(old)
+    return {"inserted": inserted, "updated": updated, "deleted": deleted,
+            "field_changes": dict(field_changes.most_common()), "duplicate_ids": dict(duplicate_ids)}
+
+
+# Diff one table between two export directories
+def diff_table(table, old_data_dir, new_data_dir, partitions=64, tmp_dir=None):
+    with tempfile.TemporaryDirectory(dir=tmp_dir) as work_dir:
+        old_dir = os.path.join(work_dir, "old")
+        new_dir = os.path.join(work_dir, "new")
+        os.mkdir(old_dir)
+        os.mkdir(new_dir)
+        partition_snapshot(file_path(table, old_data_dir), old_dir, partitions)
+        partition_snapshot(file_path(table, new_data_dir), new_dir, partitions)
+        return diff_partitions(old_dir, new_dir, partitions)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Diff two exports of receipts, users and brands by _id")
+    parser.add_argument("old_dir", help="directory holding the previous export")
+    parser.add_argument("new_dir", help="directory holding the new export")
+    parser.add_argument("--tables", nargs="*", default=list(file_names), help="tables to diff")
+    parser.add_argument("--partitions", type=int, default=64, help="number of hash partitions")
+    parser.add_argument("--output", default=None, help="directory to write the inserted/updated/deleted id lists")
+    args = parser.parse_args()
+
+    for table in args.tables:
+        result = diff_table(table, args.old_dir, args.new_dir, args.partitions)
+        print(f"\n{'=' * 30} SNAPSHOT DIFF FOR {table.capitalize()} {'=' * 30}")
+        print(f"Inserted: {len(result['inserted'])}, Updated: {len(result['updated'])}, "
+              f"Deleted: {len(result['deleted'])}")
+        print(f"Field-level changes: {result['field_changes']}")
+        if result["duplicate_ids"]:
+            print(f"Duplicate ids skipped: {result['duplicate_ids']}")
+        if args.output:
+            os.makedirs(args.output, exist_ok=True)
+            for change in ["inserted", "updated", "deleted"]:
+                with open(os.path.join(args.output, f"{table}_{change}.txt"), "w", encoding="utf-8") as file:
+                    file.writelines(f"{record_id}\n" for record_id in sorted(result[change]))
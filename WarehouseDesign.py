@@ -0,0 +1,280 @@
+import argparse
+import math
+import os
+import re
+from collections import Counter
+
+import pyarrow as pa
+import pyarrow.compute as pc
+
+from ColumnarTables import load_arrow_tables, sql_names
+
+# VARCHAR widths are rounded up to one of these sizes, with 20% headroom over the longest value seen
+varchar_sizes = [8, 16, 32, 64, 128, 256, 512, 1024, 4096, 65535]
+
+# Money and points columns are DECIMAL, other floating columns DOUBLE PRECISION
+decimal_columns = re.compile(r"price|spent|^pointsEarned$", re.I)
+
+# Primary and foreign keys of ReadJSON.py and FetchHomeWork.sql, kept as constraints for the planner
+table_keys = {
+    "brands": {"primary_key": "brands_id", "references": {}},
+    "users": {"primary_key": "users_id", "references": {}},
+    "receipts": {"primary_key": "receipts_id", "references": {"userId": "users (users_id)"}},
+    "ReceiptsRewardsReceiptItemList": {"primary_key": "item_id", "references": {"receipts_id": "receipts (receipts_id)"}},
+}
+
+# Ids are fixed width by construction, other fixed-width strings (barcodes, codes) may grow
+id_columns = re.compile(r"(_id|Id)$")
+
+# Redshift encodings by column type, low-cardinality strings get BYTEDICT instead
+type_encodings = {"SMALLINT": "AZ64", "INTEGER": "AZ64", "BIGINT": "AZ64", "DECIMAL": "AZ64",
+                  "TIMESTAMP": "AZ64", "DOUBLE PRECISION": "ZSTD", "BOOLEAN": "ZSTD", "VARCHAR": "ZSTD"}
+
+
+# Cardinality, width and range of one column
+def profile_column(column):
+    profile = {"type": column.type, "rows": len(column), "nulls": column.null_count,
+               "distinct": pc.count_distinct(column).as_py()}
+    valid = len(column) - column.null_count
+    if valid and (pa.types.is_string(column.type) or pa.types.is_integer(column.type)):
+        top = pc.max(pc.struct_field(pc.value_counts(column.drop_null()), "counts")).as_py()
+        profile["top_share"] = top / valid
+    if pa.types.is_string(column.type):
+        lengths = pc.binary_length(column)
+        profile["max_length"] = pc.max(lengths).as_py() or 0
+        profile["min_length"] = pc.min(lengths).as_py() or 0
+        if valid:
+            profile["length_quantiles"] = pc.quantile(lengths.drop_null(), q=[0.5, 0.95, 0.99]).to_pylist()
+    elif (pa.types.is_integer(column.type) or pa.types.is_floating(column.type)) and valid:
+        bounds = pc.min_max(column).as_py()
+        profile["min"], profile["max"] = bounds["min"], bounds["max"]
+        if pa.types.is_floating(column.type):
+            values = column.drop_null()
+            profile["cents"] = pc.all(pc.less(pc.abs(pc.subtract(values, pc.round(values, 2))), 1e-9)).as_py()
+    return profile
+
+
+# Integer type one size above the smallest that holds every value seen, so later exports with larger
+# values still load
+def integer_type(profile):
+    largest = max(abs(profile["min"]), abs(profile["max"]))
+    if largest < 2 ** 15:
+        return "INTEGER"
+    return "BIGINT"
+
+
+# Redshift type for the values seen, with headroom: integers one size up, strings other than ids longer.
+# Floating columns stay DECIMAL or DOUBLE even when this export only has whole numbers, a quantity of a
+# weighed item (barcode 4011) can be fractional
+def column_type(name, profile, key=False):
+    column_type = profile["type"]
+    if profile["nulls"] == profile["rows"]:
+        return "VARCHAR(16)"
+    if pa.types.is_boolean(column_type):
+        return "BOOLEAN"
+    if pa.types.is_timestamp(column_type):
+        return "TIMESTAMP"
+    if pa.types.is_integer(column_type):
+        return integer_type(profile)
+    if pa.types.is_floating(column_type):
+        if decimal_columns.search(name) and profile["cents"]:
+            digits = len(str(int(max(abs(profile["min"]), abs(profile["max"])))))
+            return f"DECIMAL({min(38, digits + 2 + 2)},2)"
+        return "DOUBLE PRECISION"
+    fixed_width = profile["min_length"] == profile["max_length"] and profile["distinct"] >= 10
+    if fixed_width and (key or id_columns.search(name)):
+        return f"VARCHAR({max(1, profile['max_length'])})"
+    width = math.ceil(profile["max_length"] * 1.2)
+    return f"VARCHAR({next((size for size in varchar_sizes if size >= width), varchar_sizes[-1])})"
+
+
+def column_encoding(sql_type, profile, sort_key=False):
+    # The leading sort key column is left uncompressed so zone maps prune without decoding
+    if sort_key:
+        return "RAW"
+    base_type = sql_type.split("(")[0]
+    valid = profile["rows"] - profile["nulls"]
+    if base_type == "VARCHAR" and profile["distinct"] <= 255 and profile["distinct"] <= 0.1 * valid:
+        return "BYTEDICT"
+    return type_encodings[base_type]
+
+
+# Join and filter frequencies of the queries in a SQL file, aliases are resolved in the order they appear
+def query_stats(sql_text, table_columns):
+    text = re.sub(r"--[^\n]*", " ", sql_text)
+    text = re.sub(r"/\*.*?\*/", " ", text, flags=re.S)
+    lower_tables = {name.lower(): name for name in table_columns}
+    keywords = {"on", "where", "join", "left", "right", "inner", "group", "order", "limit", "as"}
+    pattern = re.compile(
+        r"\b(?:FROM|JOIN)\s+(?P<table>\w+)(?:\s+(?:AS\s+)?(?P<alias>\w+))?"
+        r"|\bON\s+(?P<a1>\w+)\.(?P<c1>\w+)\s*=\s*(?P<a2>\w+)\.(?P<c2>\w+)"
+        r"|\bWHERE\s+(?P<where>.*?)(?=\bGROUP\s+BY\b|\bORDER\s+BY\b|\bLIMIT\b|\bSELECT\b|;|$)",
+        flags=re.I | re.S)
+
+    aliases = {}
+    joins = Counter()
+    filters = Counter()
+
+    def resolve(alias, column):
+        table = aliases.get(alias.lower())
+        if table and column in table_columns[table]:
+            return table, column
+        return None
+
+    for match in pattern.finditer(text):
+        if match.group("table"):
+            table = lower_tables.get(match.group("table").lower())
+            alias = match.group("alias")
+            if alias and alias.lower() not in keywords:
+                aliases[alias.lower()] = table
+            aliases[match.group("table").lower()] = table
+        elif match.group("a1"):
+            left = resolve(match.group("a1"), match.group("c1"))
+            right = resolve(match.group("a2"), match.group("c2"))
+            if left and right:
+                joins[tuple(sorted([left, right]))] += 1
+        else:
+            for alias, column in re.findall(r"(\w+)\.(\w+)", match.group("where")):
+                resolved = resolve(alias, column)
+                if resolved:
+                    filters[resolved] += 1
+    return joins, filters
+
+
+# Distribution and sort keys: the most frequent join of the largest table is colocated with DISTKEY on both
+# sides, other tables small enough to copy to every node get DISTSTYLE ALL
+def plan_layout(tables, profiles, joins, filters, dist_all_rows=5_000_000, skew_limit=0.1):
+    rows = {name: table.num_rows for name, table in tables.items()}
+    join_columns = Counter()
+    for pair, count in joins.items():
+        for table, column in pair:
+            join_columns[(table, column)] += count
+
+    layout = {name: {"diststyle": "EVEN", "distkey": None, "sortkey": [], "notes": []} for name in tables}
+
+    def skewed(table, column):
+        return profiles[table][column].get("top_share", 0) > skew_limit
+
+    largest = max(rows, key=rows.get)
+    edges = [(count, rows[a[0]] + rows[b[0]], (a, b)) for (a, b), count in joins.items()
+             if largest in (a[0], b[0]) and not skewed(*a) and not skewed(*b)]
+    colocated = set()
+    if edges:
+        count, _, pair = max(edges)
+        for table, column in pair:
+            layout[table].update(diststyle="KEY", distkey=column)
+            layout[table]["notes"].append(f"DISTKEY {column}: colocates the join "
+                                          f"{pair[0][0]}.{pair[0][1]} = {pair[1][0]}.{pair[1][1]} ({count} queries)")
+            colocated.add(table)
+
+    for table in tables:
+        if table in colocated:
+            continue
+        candidates = [(count, column) for (name, column), count in join_columns.items()
+                      if name == table and not skewed(name, column)]
+        if rows[table] <= dist_all_rows:
+            layout[table]["diststyle"] = "ALL"
+            layout[table]["notes"].append(f"DISTSTYLE ALL: {rows[table]} rows, joins stay local on every node")
+        elif candidates:
+            count, column = max(candidates)
+            layout[table].update(diststyle="KEY", distkey=column)
+            layout[table]["notes"].append(f"DISTKEY {column}: most joined column ({count} queries)")
+
+    # Leading sort key is the most filtered column (range pruning), then the join column (merge joins)
+    for table in tables:
+        filtered = [(count, column) for (name, column), count in filters.items() if name == table]
+        joined = [(count, column) for (name, column), count in join_columns.items() if name == table]
+        sortkey = []
+        if filtered:
+            sortkey.append(max(filtered)[1])
+        join_column = layout[table]["distkey"] or (max(joined)[1] if joined else None)
+        if join_column and join_column not in sortkey:
+            sortkey.append(join_column)
+        layout[table]["sortkey"] = sortkey
+        if sortkey:
+            layout[table]["notes"].append(f"SORTKEY {', '.join(sortkey)}: filtered {max(filtered)[0] if filtered else 0}"
+                                          f" times, joined {max(joined)[0] if joined else 0} times")
+    return layout
+
+
+def length_comment(profile):
+    if "length_quantiles" not in profile:
+        return ""
+    p50, p95, p99 = (round(length) for length in profile["length_quantiles"])
+    return f"length p50 {p50}, p95 {p95}, p99 {p99}, max {profile['max_length']}"
+
+
+# Right-sized CREATE TABLE statement with encodings, distribution and sort keys, column attributes in
+# Redshift's order (ENCODE before constraints). Only key columns are NOT NULL, a column without nulls in
+# this export may still have them in the next one
+def create_table(name, profiles, layout, identity_column=None):
+    sortkey = layout["sortkey"]
+    keys = table_keys.get(name, {"primary_key": None, "references": {}})
+    columns = []
+    if identity_column:
+        constraint = " PRIMARY KEY" if keys["primary_key"] == identity_column else ""
+        columns.append((identity_column, f"BIGINT IDENTITY(1,1) ENCODE AZ64{constraint}", ""))
+    notes = list(layout["notes"])
+    for column, profile in profiles.items():
+        primary = column == keys["primary_key"]
+        reference = keys["references"].get(column)
+        sql_type = column_type(column, profile, key=primary or reference is not None)
+        encoding = column_encoding(sql_type, profile, sort_key=bool(sortkey) and column == sortkey[0])
+        constraint = " NOT NULL" if primary or (reference and profile["nulls"] == 0) else ""
+        if primary:
+            constraint += " PRIMARY KEY"
+            if profile["distinct"] < profile["rows"]:
+                notes.append(f"{column} has {profile['rows'] - profile['distinct']} duplicate or missing values, "
+                             f"Redshift does not enforce PRIMARY KEY so deduplicate before loading")
+        if reference:
+            constraint += f" REFERENCES {reference}"
+        columns.append((column, f"{sql_type} ENCODE {encoding}{constraint}", length_comment(profile)))
+
+    width = max(len(column) for column, _, _ in columns)
+    lines = []
+    for i, (column, definition, comment) in enumerate(columns):
+        line = "    " + column.ljust(width) + " " + definition + ("," if i < len(columns) - 1 else "")
+        lines.append(f"{line}  -- {comment}" if comment else line)
+    notes = [f"-- {note}" for note in notes]
+    statement = "\n".join(notes + [f"CREATE TABLE IF NOT EXISTS {name}\n(\n" + "\n".join(lines) + "\n)"])
+    statement += f"\nDISTSTYLE {layout['diststyle']}"
+    if layout["distkey"]:
+        statement += f"\nDISTKEY ({layout['distkey']})"
+    if sortkey:
+        statement += f"\nCOMPOUND SORTKEY ({', '.join(sortkey)})"
+    return statement + ";"
+
+
+# Loaded tables under the FetchHomeWork.sql table and column names
+def sql_tables(data_dir=None):
+    tables = {}
+    for name, table in load_arrow_tables(data_dir).items():
+        sql_name, renames = sql_names[name]
+        tables[sql_name] = table.rename_columns([renames.get(c, c) for c in table.column_names])
+    return tables
+
+
+def generate_ddl(data_dir=None, sql_file="FetchHomeWork.sql", dist_all_rows=5_000_000):
+    tables = sql_tables(data_dir)
+    profiles = {name: {column: profile_column(table.column(column)) for column in table.column_names}
+                for name, table in tables.items()}
+    with open(sql_file, "r", encoding="utf-8") as file:
+        joins, filters = query_stats(file.read(), {name: set(table.column_names) for name, table in tables.items()})
+    layout = plan_layout(tables, profiles, joins, filters, dist_all_rows)
+    return [create_table(name, profiles[name], layout[name],
+                         identity_column="item_id" if name == sql_names["rewards_items"][0] else None)
+            for name in tables]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate Redshift DDL sized and laid out from the data")
+    parser.add_argument("--data-dir", default=None, help="directory holding the JSON exports")
+    parser.add_argument("--sql-file", default=os.path.join(os.getcwd(), "FetchHomeWork.sql"),
+                        help="queries used for the join and filter frequencies")
+    parser.add_argument("--dist-all-rows", type=int, default=5_000_000,
+                        help="tables up to this many rows are copied to every node (DISTSTYLE ALL)")
+    args = parser.parse_args()
+
+    for statement in generate_ddl(args.data_dir, args.sql_file, args.dist_all_rows):
+        print(statement)
+        print()